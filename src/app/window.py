@@ -1,31 +1,109 @@
-import pandas as pd
-from PyQt5.QtWidgets import QMainWindow, QFileDialog, QMessageBox
-from PyQt5.QtGui import QColor, QSyntaxHighlighter, QTextCharFormat, QTextDocument
-import re
+import sqlite3
+from bisect import bisect_right
+from PyQt5.QtCore import QEvent, QObject, QPoint, QThreadPool, QTimer
+from PyQt5.QtWidgets import QCheckBox, QMainWindow, QFileDialog, QMessageBox, QProgressBar, QPushButton, QTextEdit
+from PyQt5.QtGui import QColor, QSyntaxHighlighter, QTextCharFormat
 from src.app.design import Ui_MainWindow
-from src.model.model import GBDDModel
-from src.processing.metircs import MetricsCppCode
+from src.app.worker import SearchWorker
+from src.model.inference import GBDDPredictor
+from src.processing.cache import FunctionCache
+from src.processing.functions import Function, find_functions, function_hash
+
+# Задержка повторного анализа после редактирования текста, мс
+AUTO_UPDATE_DELAY = 700
 
 
 class SyntaxHighlighter(QSyntaxHighlighter):
-    def __init__(self, document: QTextDocument):
-        super().__init__(document)
-        self.__highlight_lines: dict[int, QTextCharFormat] = {}
+    """
+    Подсветка диапазонов строк [start_line, end_line): формат строки находится двоичным поиском
+    по началам диапазонов. Перерисовываются только изменившиеся блоки, причём сразу — только видимые,
+    остальные — при прокрутке к ним или изменении размера окна. Неперерисованные строки хранятся
+    непересекающимися диапазонами, перерисованные из них удаляются
+    """
+    def __init__(self, editor: QTextEdit):
+        super().__init__(editor.document())
+        self.__editor = editor
+        self.__ranges: list[tuple[int, int, QTextCharFormat]] = []
+        self.__starts: list[int] = []
+        self.__dirty: list[tuple[int, int]] = []
+        editor.verticalScrollBar().valueChanged.connect(self.__rehighlight_visible)
+        editor.viewport().installEventFilter(self)
+
+    def eventFilter(self, watched: QObject, event: QEvent) -> bool:
+        # При увеличении области просмотра видимыми становятся и неперерисованные строки
+        if event.type() == QEvent.Resize:
+            self.__rehighlight_visible()
+        return super().eventFilter(watched, event)
+
+    def set_ranges(self, ranges: list[tuple[int, int, QTextCharFormat]]):
+        ranges = sorted(ranges, key=lambda highlight_range: highlight_range[0])
+        old_keys = {(start, end, id(line_format)) for start, end, line_format in self.__ranges}
+        new_keys = {(start, end, id(line_format)) for start, end, line_format in ranges}
+        unchanged_keys = old_keys & new_keys
 
-    def highlight_line(self, line: int, line_format: QTextCharFormat):
-        self.__highlight_lines[line] = line_format
-        block = super().document().findBlockByLineNumber(line)
-        super().rehighlightBlock(block)
+        self.__dirty = self.__merge_lines(self.__dirty + [
+            (start, end) for start, end, line_format in self.__ranges + ranges
+            if (start, end, id(line_format)) not in unchanged_keys])
+        self.__ranges = ranges
+        self.__starts = [start for start, _, _ in ranges]
+        self.__rehighlight_visible()
+
+    def update_ranges(self, ranges: list[tuple[int, int, QTextCharFormat]]):
+        self.set_ranges(self.__ranges + ranges)
 
     def clear(self):
-        self.__highlight_lines = {}
-        super().rehighlight()
+        self.set_ranges([])
+
+    @staticmethod
+    def __merge_lines(lines_ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        # Объединение пересекающихся и соседних диапазонов строк
+        merged: list[tuple[int, int]] = []
+        for start, end in sorted(lines_ranges):
+            if start >= end:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def __get_visible_blocks(self) -> tuple[int, int]:
+        first_block = self.__editor.cursorForPosition(QPoint(0, 0)).blockNumber()
+        last_block = self.__editor.cursorForPosition(QPoint(0, self.__editor.viewport().height() - 1)).blockNumber()
+        return first_block, last_block + 1
+
+    def __rehighlight_visible(self):
+        if not self.__dirty:
+            return
+
+        first_block, end_block = self.__get_visible_blocks()
+        visible_lines: set[int] = set()
+        dirty: list[tuple[int, int]] = []
+
+        for start, end in self.__dirty:
+            visible_start, visible_end = max(start, first_block), min(end, end_block)
+            if visible_start >= visible_end:
+                dirty.append((start, end))
+                continue
+
+            visible_lines.update(range(visible_start, visible_end))
+            if start < visible_start:
+                dirty.append((start, visible_start))
+            if visible_end < end:
+                dirty.append((visible_end, end))
+        self.__dirty = dirty
+
+        document = super().document()
+        for line in sorted(visible_lines):
+            super().rehighlightBlock(document.findBlockByNumber(line))
 
     def highlightBlock(self, text: str):
         line = super().currentBlock().blockNumber()
-        line_format = self.__highlight_lines.get(line)
-        if line_format is not None:
-            super().setFormat(0, len(text), line_format)
+        idx = bisect_right(self.__starts, line) - 1
+        if idx >= 0:
+            _, end, line_format = self.__ranges[idx]
+            if line < end:
+                super().setFormat(0, len(text), line_format)
 
 
 class Window(QMainWindow, Ui_MainWindow):
@@ -33,16 +111,49 @@ class Window(QMainWindow, Ui_MainWindow):
         super().__init__()
         self.setupUi(self)
         self.setWindowTitle('Система обнаружения дефектов ПО')
-        self.__highlighter = SyntaxHighlighter(self.program_txt.document())
+        self.__highlighter = SyntaxHighlighter(self.program_txt)
+
+        self.__model = GBDDPredictor(model_file='./app/model.ubj')
+        try:
+            self.__cache: FunctionCache | None = FunctionCache()
+        except (OSError, sqlite3.Error):
+            # Без кэша анализ работает так же, только медленнее при повторном открытии файлов
+            self.__cache = None
+        self.__functions_proba: dict[str, float] = {}
+        # Вероятности дефектов строк функций, локализованных скользящим окном
+        self.__lines_proba: dict[str, list[float]] = {}
+        self.__functions: dict[str, list[Function]] = {}
+        self.__formats: dict[str, QTextCharFormat] = {}
+        # Номер текущего запуска поиска и запущенные поиски, включая отменённые, пока они не завершились:
+        # окно владеет объектами поиска, сигналы подключены к методам окна и передают номер запуска
+        self.__run_id = 0
+        self.__workers: dict[int, SearchWorker] = {}
+
+        self.__progress_bar = QProgressBar(self.statusbar)
+        self.__cancel_btn = QPushButton('Отменить', self.statusbar)
+        self.__cancel_btn.clicked.connect(self.cancel_searching)
+        self.statusbar.addPermanentWidget(self.__progress_bar)
+        self.statusbar.addPermanentWidget(self.__cancel_btn)
+        self.__show_progress(False)
 
-        self.__model = GBDDModel(model_file='./app/model.pkl')
-        self.__metrics = MetricsCppCode()
+        self.__auto_update = False
+        self.__update_timer = QTimer(self)
+        self.__update_timer.setSingleShot(True)
+        self.__update_timer.setInterval(AUTO_UPDATE_DELAY)
+        self.__update_timer.timeout.connect(self.run_searching)
+        self.program_txt.document().contentsChange.connect(self.__on_contents_change)
 
         self.load_btn.clicked.connect(self.open_file)
         self.clear_btn.clicked.connect(self.clean_editor)
         self.run_btn.clicked.connect(self.run_searching)
 
+        self.__localize_box = QCheckBox('Подсветка по строкам', self.verticalLayoutWidget)
+        self.__localize_box.setToolTip('Оценка окон строк внутри длинных функций вместо одной оценки функции')
+        self.__localize_box.toggled.connect(self.__on_localize_toggled)
+        self.verticalLayout.addWidget(self.__localize_box)
+
     def open_file(self):
+        self.__stop_auto_update()
         self.__highlighter.clear()
 
         options = QFileDialog.Options()
@@ -54,50 +165,144 @@ class Window(QMainWindow, Ui_MainWindow):
             try:
                 with open(filename, 'r', encoding='utf8') as file:
                     self.program_txt.setPlainText(file.read())
-                    QMessageBox.information(self, 'Предупреждение', 'Обратите внимание, что анализироваться будут '
-                                                                    'функции, содержащие не более 2000 строк')
             except FileNotFoundError:
                 QMessageBox.critical(self, 'Ошибка', 'Такого файла не существует')
 
     def clean_editor(self):
+        self.__stop_auto_update()
         self.__highlighter.clear()
         self.program_txt.clear()
 
-    def __split_code_by_functions(self) -> list[tuple[int, int, str]]:
-        text_program = self.program_txt.toPlainText()
-        func_pattern = r'[\w\*]+\s+\w+\(.*\)\s*{([^{}]|{([^{}]|{([^{}]|{([^{}]|{[^{}]})*})*})*})*}'
-        func_matches = re.finditer(func_pattern, text_program)
-        functions: list[tuple[int, int, str]] = []
+    def __stop_auto_update(self):
+        self.__auto_update = False
+        self.__update_timer.stop()
+        self.cancel_searching()
 
-        for function in func_matches:
-            start_line = len(MetricsCppCode.split_code_by_lines(text_program[:function.start()])) - 1
-            end_line = len(MetricsCppCode.split_code_by_lines(text_program[:function.end()]))
-            functions.append((start_line, end_line, function.group()))
+    def __show_progress(self, visible: bool):
+        self.__progress_bar.setVisible(visible)
+        self.__cancel_btn.setVisible(visible)
 
-        return functions
+    def __on_localize_toggled(self, _checked: bool):
+        # Результаты другого режима не подходят, анализ выполняется заново
+        self.__functions_proba = {}
+        self.__lines_proba = {}
+        if self.__auto_update:
+            self.run_searching()
 
-    def run_searching(self):
-        functions = self.__split_code_by_functions()
-        self.__highlighter.clear()
+    def __on_contents_change(self, _position: int, removed: int, added: int):
+        # После первого запуска анализ повторяется автоматически, когда пользователь перестаёт печатать
+        if self.__auto_update and (removed or added):
+            self.__update_timer.start()
 
-        for function in functions:
-            self.__metrics.set_function_code(function[2])
-            metrics = self.__metrics.count()
-            defects_proba = self.__model.predict_proba(pd.DataFrame(metrics, index=[0]))[0][1]
-
-            if 0. <= defects_proba < 0.2:
-                color = 'lightBlue'
-            elif 0.2 <= defects_proba < 0.4:
-                color = 'lightGreen'
-            elif 0.4 <= defects_proba < 0.6:
-                color = 'yellow'
-            elif 0.6 <= defects_proba < 0.8:
-                color = 'orange'
-            else:
-                color = 'red'
+    def __split_code_by_functions(self) -> list[Function]:
+        return find_functions(self.program_txt.toPlainText())
 
+    def __get_format(self, defects_proba: float) -> QTextCharFormat:
+        if 0. <= defects_proba < 0.2:
+            color = 'lightBlue'
+        elif 0.2 <= defects_proba < 0.4:
+            color = 'lightGreen'
+        elif 0.4 <= defects_proba < 0.6:
+            color = 'yellow'
+        elif 0.6 <= defects_proba < 0.8:
+            color = 'orange'
+        else:
+            color = 'red'
+
+        line_format = self.__formats.get(color)
+        if line_format is None:
             line_format = QTextCharFormat()
             line_format.setBackground(QColor(color))
+            self.__formats[color] = line_format
+        return line_format
+
+    def __get_ranges(self, body_hash: str) -> list[tuple[int, int, QTextCharFormat]]:
+        lines_proba = self.__lines_proba.get(body_hash)
+        if lines_proba is None:
+            line_format = self.__get_format(self.__functions_proba[body_hash])
+            return [(function.start_line, function.end_line, line_format)
+                    for function in self.__functions.get(body_hash, [])]
+
+        # Соседние строки с одинаковым цветом объединяются в один диапазон
+        line_ranges: list[tuple[int, int, QTextCharFormat]] = []
+        for line, line_proba in enumerate(lines_proba):
+            line_format = self.__get_format(line_proba)
+            if line_ranges and line_ranges[-1][2] is line_format:
+                line_ranges[-1] = (line_ranges[-1][0], line + 1, line_format)
+            else:
+                line_ranges.append((line, line + 1, line_format))
+
+        return [(function.start_line + start, function.start_line + end, line_format)
+                for function in self.__functions.get(body_hash, []) for start, end, line_format in line_ranges]
+
+    def run_searching(self):
+        self.__update_timer.stop()
+        self.__auto_update = True
+        self.cancel_searching()
+
+        self.__functions = {}
+        for function in self.__split_code_by_functions():
+            self.__functions.setdefault(function_hash(function.text), []).append(function)
+
+        # Функции, вероятности которых уже известны, подсвечиваются сразу,
+        # остальные — по мере получения результатов из фонового потока
+        self.__functions_proba = {body_hash: self.__functions_proba[body_hash] for body_hash in self.__functions
+                                  if body_hash in self.__functions_proba}
+        self.__lines_proba = {body_hash: self.__lines_proba[body_hash] for body_hash in self.__functions_proba
+                              if body_hash in self.__lines_proba}
+        highlight_ranges: list[tuple[int, int, QTextCharFormat]] = []
+        for body_hash in self.__functions_proba:
+            highlight_ranges.extend(self.__get_ranges(body_hash))
+        self.__highlighter.set_ranges(highlight_ranges)
+
+        changed_functions = {body_hash: functions[0] for body_hash, functions in self.__functions.items()
+                             if body_hash not in self.__functions_proba}
+        if not changed_functions:
+            return
+
+        self.__run_id += 1
+        worker = SearchWorker(self.__run_id, changed_functions, self.__model, self.__cache,
+                              self.__localize_box.isChecked())
+        worker.signals.results.connect(self.__on_results)
+        worker.signals.progress.connect(self.__on_progress)
+        worker.signals.failed.connect(self.__on_failed)
+        worker.signals.finished.connect(self.__on_finished)
+        self.__workers[self.__run_id] = worker
+
+        self.__progress_bar.setRange(0, len(changed_functions))
+        self.__progress_bar.setValue(0)
+        self.__show_progress(True)
+        QThreadPool.globalInstance().start(worker)
+
+    def cancel_searching(self):
+        worker = self.__workers.get(self.__run_id)
+        if worker is not None:
+            worker.cancel()
+        # Результаты отменённого запуска, которые ещё придут, не используются
+        self.__run_id += 1
+        self.__show_progress(False)
+
+    def __on_results(self, run_id: int, results: list[tuple[str, float, list[float] | None]]):
+        if run_id != self.__run_id:
+            return
+
+        highlight_ranges: list[tuple[int, int, QTextCharFormat]] = []
+        for body_hash, defects_proba, lines_proba in results:
+            self.__functions_proba[body_hash] = defects_proba
+            if lines_proba is not None:
+                self.__lines_proba[body_hash] = lines_proba
+            highlight_ranges.extend(self.__get_ranges(body_hash))
+        self.__highlighter.update_ranges(highlight_ranges)
+
+    def __on_progress(self, run_id: int, done: int, _total: int):
+        if run_id == self.__run_id:
+            self.__progress_bar.setValue(done)
+
+    def __on_failed(self, run_id: int, message: str):
+        if run_id == self.__run_id:
+            QMessageBox.critical(self, 'Ошибка', f'Не удалось выполнить анализ: {message}')
 
-            for line in range(function[0], function[1]):
-                self.__highlighter.highlight_line(line, line_format)
+    def __on_finished(self, run_id: int, _cancelled: bool):
+        self.__workers.pop(run_id, None)
+        if run_id == self.__run_id:
+            self.__show_progress(False)
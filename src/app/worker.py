@@ -0,0 +1,120 @@
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+from src.model.config import FEATURES
+from src.model.inference import GBDDPredictor
+from src.processing.cache import FunctionCache
+from src.processing.functions import Function
+from src.processing.halstead import MetricsBatch
+from src.processing.lexer import tokenize
+from src.processing.localization import WINDOW_LINES, line_risks, split_line_counts, window_counts
+from src.processing.metircs import MetricsCppCode
+
+# Количество функций, результаты которых передаются в интерфейс одним пакетом
+RESULTS_BATCH_SIZE = 16
+
+
+class SearchSignals(QObject):
+    # Первый аргумент каждого сигнала — номер запуска поиска (run_id)
+    results = pyqtSignal(int, list)
+    progress = pyqtSignal(int, int, int)
+    failed = pyqtSignal(int, str)
+    finished = pyqtSignal(int, bool)
+
+
+class SearchWorker(QRunnable):
+    """
+    Вычисление метрик и вероятностей дефектов в пуле потоков Qt.
+    Результаты отправляются пакетами [(хэш функции, вероятность, вероятности строк или None), ...]
+    по мере готовности, в главном потоке остаётся только подсветка. Функции из кэша отправляются сразу,
+    без вычисления метрик. С localize для функций длиннее окна оцениваются окна строк (localization),
+    окна всех функций пакета передаются модели одним вызовом вместе с самими функциями.
+    Сигналы передают run_id, чтобы получатель отличал результаты текущего запуска от прежних
+    """
+    def __init__(self, run_id: int, functions: dict[str, Function], model: GBDDPredictor,
+                 cache: FunctionCache | None = None, localize: bool = False):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.signals = SearchSignals()
+        self.__run_id = run_id
+        self.__functions = list(functions.items())
+        self.__model = model
+        self.__cache = cache
+        self.__localize = localize
+        self.__cancelled = False
+
+    def cancel(self):
+        self.__cancelled = True
+
+    def __is_localized(self, function: Function) -> bool:
+        return self.__localize and function.end_line - function.start_line > WINDOW_LINES
+
+    def run(self):
+        metrics = MetricsCppCode()
+        metrics_batch = MetricsBatch()
+        total = len(self.__functions)
+        done = 0
+
+        try:
+            model_digest = ''
+            functions = self.__functions
+            if self.__cache is not None:
+                model_digest = self.__model.model_digest()
+                # Для локализованных функций кэш не используется: вероятности строк в нём не хранятся
+                cached = self.__cache.get_many((body_hash for body_hash, function in functions
+                                                if not self.__is_localized(function)), model_digest)
+                if cached:
+                    self.signals.results.emit(self.__run_id, [(body_hash, defects_proba, None)
+                                                              for body_hash, (_, defects_proba) in cached.items()])
+                    done = len(cached)
+                    self.signals.progress.emit(self.__run_id, done, total)
+                    functions = [(body_hash, function) for body_hash, function in functions
+                                 if body_hash not in cached]
+
+            start = 0
+            while start < len(functions) and not self.__cancelled:
+                batch = functions[start:start + RESULTS_BATCH_SIZE]
+                metrics_batch.clear()
+                functions_windows: list[list[tuple[int, int, tuple[int, ...]]] | None] = []
+                for _, function in batch:
+                    if self.__cancelled:
+                        break
+                    if not self.__is_localized(function):
+                        metrics_batch.add_function(metrics, function.text)
+                        functions_windows.append(None)
+                        continue
+
+                    # Лексемы функции разбираются один раз для метрик функции и для окон строк
+                    tokens, lines_cnt = tokenize(function.text)
+                    metrics.set_function_tokens(tokens, lines_cnt)
+                    metrics_batch.append(metrics.count_raw())
+                    functions_windows.append(window_counts(split_line_counts(tokens, lines_cnt)))
+                if self.__cancelled:
+                    break
+
+                # Окна строк добавляются в пакет после функций
+                for windows in functions_windows:
+                    for _, _, counts in windows or []:
+                        metrics_batch.append(counts)
+
+                batch_proba = self.__model.predict_proba_matrix(metrics_batch.to_matrix(FEATURES))
+                functions_proba = batch_proba[:len(batch)].tolist()
+                offset = len(batch)
+                functions_line_risks: list[list[float] | None] = []
+                for windows in functions_windows:
+                    if windows is None:
+                        functions_line_risks.append(None)
+                        continue
+                    functions_line_risks.append(line_risks(windows, batch_proba[offset:offset + len(windows)]).tolist())
+                    offset += len(windows)
+
+                if self.__cache is not None:
+                    self.__cache.put_many(((body_hash, counts, defects_proba) for (body_hash, _), counts, defects_proba
+                                           in zip(batch, metrics_batch.counts(), functions_proba)), model_digest)
+                self.signals.results.emit(self.__run_id, list(zip((body_hash for body_hash, _ in batch),
+                                                                  functions_proba, functions_line_risks)))
+                start += len(batch)
+                done += len(batch)
+                self.signals.progress.emit(self.__run_id, done, total)
+        except Exception as e:
+            self.signals.failed.emit(self.__run_id, str(e))
+
+        self.signals.finished.emit(self.__run_id, self.__cancelled)
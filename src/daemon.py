@@ -0,0 +1,229 @@
+"""
+Локальный сервис предсказания дефектов, который держит модель загруженной:
+python -m src.daemon [--host 127.0.0.1] [--port 8737] [--model FILE] [--batch-size N] [--max-delay MS]
+
+POST /analyze {"code": "..."} — поиск функций в тексте и вероятности их дефектов,
+POST /analyze {"functions": ["...", ...]} — вероятности для готового списка функций,
+GET /health — состояние сервиса.
+Метрики вычисляются в потоках обработки запросов, а одновременные запросы объединяются
+в пакеты для одного вызова модели. Клиент для pre-commit и редакторов — src.hook
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.model.config import FEATURES
+from src.model.inference import GBDDPredictor
+from src.processing.functions import find_functions
+from src.processing.halstead import MetricsBatch
+from src.processing.metircs import MetricsCppCode
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8737
+DEFAULT_MODEL_FILE = os.path.join(os.path.dirname(__file__), 'app', 'model.ubj')
+BATCH_SIZE = 1024
+# Наибольшее время ожидания других запросов для объединения в пакет, секунды
+MAX_DELAY = 0.005
+MAX_REQUEST_SIZE = 64 * 2 ** 20
+
+
+class MicroBatcher:
+    """
+    Объединение метрик функций из одновременных запросов в один вызов модели.
+    Пакет отправляется, когда набрано batch_size функций или прошло max_delay с первого запроса пакета
+    """
+    def __init__(self, model: GBDDPredictor, batch_size: int = BATCH_SIZE, max_delay: float = MAX_DELAY):
+        self.__model = model
+        self.__batch_size = batch_size
+        self.__max_delay = max_delay
+        self.__queue: queue.Queue[tuple[list[tuple[int, ...]], Future] | None] = queue.Queue()
+        self.__thread = threading.Thread(target=self.__run, name='micro-batcher', daemon=True)
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def submit(self, counts: list[tuple[int, ...]]) -> Future:
+        # Результат — список вероятностей в порядке counts
+        future: Future = Future()
+        self.__queue.put((counts, future))
+        return future
+
+    def __run(self):
+        stopped = False
+        while not stopped:
+            request = self.__queue.get()
+            if request is None:
+                break
+
+            requests = [request]
+            rows_cnt = len(request[0])
+            deadline = time.perf_counter() + self.__max_delay
+            while rows_cnt < self.__batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.__queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopped = True
+                    break
+                requests.append(request)
+                rows_cnt += len(request[0])
+
+            self.__predict(requests)
+
+    def __predict(self, requests: list[tuple[list[tuple[int, ...]], Future]]):
+        metrics_batch = MetricsBatch()
+        for counts, _ in requests:
+            for function_counts in counts:
+                metrics_batch.append(function_counts)
+
+        try:
+            functions_proba = self.__model.predict_proba_matrix(metrics_batch.to_matrix(FEATURES)).tolist()
+        except Exception as e:
+            for _, future in requests:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for counts, future in requests:
+            future.set_result(functions_proba[offset:offset + len(counts)])
+            offset += len(counts)
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    server: 'DaemonServer'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.__send(404, {'error': f'unknown path {self.path}'})
+            return
+        self.__send(200, {'status': 'ok', 'model': self.server.model_file})
+
+    def do_POST(self):
+        if self.path != '/analyze':
+            self.__send(404, {'error': f'unknown path {self.path}'})
+            return
+
+        # Размер тела проверяется до чтения. Непрочитанное тело нельзя принять за следующий запрос,
+        # поэтому после ошибки соединение закрывается
+        length = self.headers.get('Content-Length', '').strip()
+        if not (length.isascii() and length.isdigit()):
+            self.close_connection = True
+            self.__send(400, {'error': 'expected Content-Length with the request size in bytes'})
+            return
+        if int(length) > MAX_REQUEST_SIZE:
+            self.close_connection = True
+            self.__send(413, {'error': 'request is too large'})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(length)))
+            functions = self.__get_functions(request)
+        except (ValueError, TypeError) as e:
+            self.__send(400, {'error': str(e)})
+            return
+
+        try:
+            self.__send(200, {'functions': self.__analyze(functions)})
+        except Exception as e:
+            self.__send(500, {'error': str(e)})
+
+    @staticmethod
+    def __get_functions(request: dict) -> list[tuple[int | None, int | None, str]]:
+        # (первая строка с единицы, последняя строка, текст функции)
+        if isinstance(request, dict) and isinstance(request.get('code'), str):
+            return [(function.start_line + 1, function.end_line, function.text)
+                    for function in find_functions(request['code'])]
+        if isinstance(request, dict) and isinstance(request.get('functions'), list) and \
+                all(isinstance(function, str) for function in request['functions']):
+            return [(None, None, function) for function in request['functions']]
+        raise ValueError('expected {"code": str} or {"functions": [str, ...]}')
+
+    def __analyze(self, functions: list[tuple[int | None, int | None, str]]) -> list[dict]:
+        if not functions:
+            return []
+
+        metrics = MetricsCppCode()
+        counts = []
+        for _, _, function_text in functions:
+            metrics.set_function_code(function_text)
+            counts.append(metrics.count_raw())
+        functions_proba = self.server.batcher.submit(counts).result()
+
+        return [{'start_line': start_line, 'end_line': end_line, 'defects_proba': round(defects_proba, 4)}
+                for (start_line, end_line, _), defects_proba in zip(functions, functions_proba)]
+
+    def __send(self, status: int, response: dict):
+        body = json.dumps(response, ensure_ascii=False).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        # Журнал каждого запроса не нужен, ошибки передаются клиенту в ответе
+        pass
+
+
+class DaemonServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Очередь соединений socketserver по умолчанию (5) переполняется при одновременных запросах pre-commit
+    request_queue_size = 128
+
+    def __init__(self, address: tuple[str, int], model_file: str, batch_size: int, max_delay: float):
+        super().__init__(address, DaemonHandler)
+        self.model_file = model_file
+        self.batcher = MicroBatcher(GBDDPredictor(model_file=model_file), batch_size, max_delay)
+
+    def warm_up(self):
+        # Загрузка модели и отложенные импорты выполняются до первого запроса
+        metrics = MetricsCppCode('void foo() {\n}\n')
+        self.batcher.submit([metrics.count_raw()]).result()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog='python -m src.daemon', description='Локальный сервис предсказания дефектов')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='адрес сервиса')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='порт сервиса')
+    parser.add_argument('--model', default=DEFAULT_MODEL_FILE, help='файл обученной модели')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='наибольший размер пакета функций')
+    parser.add_argument('--max-delay', type=float, default=MAX_DELAY * 1e3,
+                        help='наибольшее время ожидания запросов для пакета, мс')
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.model):
+        parser.error(f'there is no model file {args.model}, do fit before serving')
+    if args.batch_size < 1 or args.max_delay < 0:
+        parser.error('--batch-size must be positive and --max-delay non-negative')
+
+    server = DaemonServer((args.host, args.port), args.model, args.batch_size, args.max_delay / 1e3)
+    server.batcher.start()
+    server.warm_up()
+    print(f'Serving on http://{args.host}:{server.server_address[1]}', file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+Анализ только тех функций, которые изменены между двумя ревизиями git:
+python -m src.diffscan [--repo DIR] [--base REV] [--head REV] [--include GLOB] [--exclude GLOB]
+    [--format jsonl|csv] [--output FILE] [--model FILE]
+
+Изменённые строки берутся из git diff -U0, функции, которые они затрагивают, находятся в обеих версиях файла,
+метрики и вероятности дефектов вычисляются только для них. Функции до и после изменения сопоставляются
+по заголовку (тексту до первой фигурной скобки), для каждой выводится изменение вероятности.
+Без --head сравнение выполняется с рабочим каталогом
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import NamedTuple, TextIO
+from src.model.config import FEATURES
+from src.model.inference import GBDDPredictor
+from src.processing.functions import Function, find_functions
+from src.processing.halstead import MetricsBatch
+from src.processing.metircs import MetricsCppCode
+from src.scan import DEFAULT_INCLUDE, DEFAULT_MODEL_FILE, matches
+
+HUNK_PATTERN = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+DIFF_COLUMNS = ['file', 'status', 'start_line', 'end_line', 'proba_before', 'proba_after', 'delta']
+
+
+class FileDiff(NamedTuple):
+    """
+    Изменения одного файла: пути до и после (None — файл добавлен или удалён)
+    и изменённые диапазоны строк (первая строка с единицы, количество строк)
+    """
+    old_path: str | None
+    new_path: str | None
+    old_ranges: list[tuple[int, int]]
+    new_ranges: list[tuple[int, int]]
+
+
+def run_git(repo: str, args: list[str], input: bytes | None = None) -> bytes:
+    return subprocess.run(['git', '-C', repo, '-c', 'core.quotepath=off', *args], input=input,
+                          capture_output=True, check=True).stdout
+
+
+def parse_diff(diff_text: str) -> list[FileDiff]:
+    files: list[FileDiff] = []
+    in_hunks = False
+
+    for line in diff_text.splitlines():
+        if line.startswith('diff --git '):
+            files.append(FileDiff(None, None, [], []))
+            in_hunks = False
+        elif not files:
+            continue
+        elif line.startswith('@@'):
+            match = HUNK_PATTERN.match(line)
+            if match is None:
+                continue
+            in_hunks = True
+            old_start, old_count, new_start, new_count = match.groups()
+            files[-1].old_ranges.append((int(old_start), int(old_count or 1)))
+            files[-1].new_ranges.append((int(new_start), int(new_count or 1)))
+        elif in_hunks:
+            # Строки изменений (при -U0 контекста нет) могут начинаться с --- и +++
+            continue
+        elif line.startswith('--- ') or line.startswith('+++ '):
+            path = line[4:].rstrip('\t')
+            path = None if path == '/dev/null' else path[2:]
+            if line.startswith('---'):
+                files[-1] = files[-1]._replace(old_path=path)
+            else:
+                files[-1] = files[-1]._replace(new_path=path)
+
+    return files
+
+
+def read_revision_files(repo: str, revision: str | None, paths: list[str]) -> dict[str, str]:
+    """Тексты файлов в ревизии (None — рабочий каталог), отсутствующие файлы пропускаются"""
+    texts: dict[str, str] = {}
+    if revision is None:
+        for path in paths:
+            try:
+                with open(os.path.join(repo, path), encoding='utf8', errors='replace') as f:
+                    texts[path] = f.read()
+            except FileNotFoundError:
+                pass
+        return texts
+
+    # Все файлы читаются одним процессом git cat-file --batch
+    output = run_git(repo, ['cat-file', '--batch'], ''.join(f'{revision}:{path}\n' for path in paths).encode('utf8'))
+    position = 0
+    for path in paths:
+        header_end = output.index(b'\n', position)
+        header = output[position:header_end].split()
+        position = header_end + 1
+        if header[-1] == b'missing' or len(header) != 3:
+            continue
+        size = int(header[2])
+        texts[path] = output[position:position + size].decode('utf8', errors='replace')
+        position += size + 1
+
+    return texts
+
+
+def is_touched(function: Function, ranges: list[tuple[int, int]]) -> bool:
+    first_line, last_line = function.start_line + 1, function.end_line
+    for start, count in ranges:
+        if count == 0:
+            # Строки удалены (или добавлены с другой стороны) между start и start + 1
+            if first_line <= start and start + 1 <= last_line:
+                return True
+        elif start <= last_line and first_line <= start + count - 1:
+            return True
+    return False
+
+
+def function_header(function: Function) -> str:
+    return ' '.join(function.text.split('{', 1)[0].split())
+
+
+def find_changed_functions(file_diff: FileDiff, old_text: str | None,
+                           new_text: str | None) -> list[tuple[str, Function | None, Function | None]]:
+    """
+    Пары (статус, функция до, функция после) для функций, затронутых изменениями,
+    статус: added, removed или modified
+    """
+    old_functions = find_functions(old_text) if old_text is not None else []
+    new_functions = find_functions(new_text) if new_text is not None else []
+    old_by_header = {function_header(function): function for function in old_functions}
+    new_by_header = {function_header(function): function for function in new_functions}
+
+    changed: list[tuple[str, Function | None, Function | None]] = []
+    paired_headers: set[str] = set()
+    for function in new_functions:
+        if is_touched(function, file_diff.new_ranges):
+            header = function_header(function)
+            old_function = old_by_header.get(header)
+            paired_headers.add(header)
+            changed.append(('added' if old_function is None else 'modified', old_function, function))
+
+    for function in old_functions:
+        header = function_header(function)
+        if header in paired_headers or not is_touched(function, file_diff.old_ranges):
+            continue
+        new_function = new_by_header.get(header)
+        changed.append(('removed' if new_function is None else 'modified', function, new_function))
+
+    return changed
+
+
+class DiffWriter:
+    def __init__(self, output: TextIO, output_format: str):
+        self.__output = output
+        self.__csv_writer = None
+        if output_format == 'csv':
+            self.__csv_writer = csv.DictWriter(output, fieldnames=DIFF_COLUMNS)
+            self.__csv_writer.writeheader()
+
+    def write(self, row: dict):
+        if self.__csv_writer is not None:
+            self.__csv_writer.writerow(row)
+        else:
+            self.__output.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def diffscan(repo: str, base: str, head: str | None, model_file: str, writer: DiffWriter,
+             include: list[str], exclude: list[str]) -> tuple[int, int]:
+    diff_args = ['diff', '-U0', '--no-color', '--no-ext-diff', '-M', '--src-prefix=a/', '--dst-prefix=b/', base]
+    file_diffs = [file_diff for file_diff in parse_diff(run_git(repo, diff_args + ([head] if head else []))
+                                                        .decode('utf8', errors='replace'))
+                  if any(path is not None and matches(path, include) and not matches(path, exclude)
+                         for path in (file_diff.new_path, file_diff.old_path))]
+
+    old_texts = read_revision_files(repo, base, [diff.old_path for diff in file_diffs if diff.old_path])
+    new_texts = read_revision_files(repo, head, [diff.new_path for diff in file_diffs if diff.new_path])
+
+    metrics = MetricsCppCode()
+    metrics_batch = MetricsBatch()
+    rows: list[dict] = []
+    # Для каждой строки результата — номера вероятностей до и после в пакете (None — функции нет)
+    batch_indices: list[tuple[int | None, int | None]] = []
+
+    def add_function(function: Function | None) -> int | None:
+        if function is None:
+            return None
+        metrics_batch.add_function(metrics, function.text)
+        return len(metrics_batch) - 1
+
+    for file_diff in file_diffs:
+        changed = find_changed_functions(file_diff, old_texts.get(file_diff.old_path),
+                                         new_texts.get(file_diff.new_path))
+        for status, old_function, new_function in changed:
+            function = new_function or old_function
+            rows.append({
+                'file': file_diff.new_path or file_diff.old_path,
+                'status': status,
+                'start_line': function.start_line + 1,
+                'end_line': function.end_line,
+            })
+            batch_indices.append((add_function(old_function), add_function(new_function)))
+
+    functions_proba = GBDDPredictor(model_file=model_file).predict_proba_matrix(metrics_batch.to_matrix(FEATURES))
+    for row, (old_idx, new_idx) in zip(rows, batch_indices):
+        proba_before = round(float(functions_proba[old_idx]), 4) if old_idx is not None else None
+        proba_after = round(float(functions_proba[new_idx]), 4) if new_idx is not None else None
+        row.update({
+            'proba_before': proba_before,
+            'proba_after': proba_after,
+            'delta': round((proba_after or 0.) - (proba_before or 0.), 4),
+        })
+        writer.write(row)
+
+    return len(file_diffs), len(metrics_batch)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m src.diffscan',
+                                     description='Поиск дефектов в функциях, изменённых между ревизиями git')
+    parser.add_argument('--repo', default='.', help='каталог репозитория git')
+    parser.add_argument('--base', default='HEAD', help='исходная ревизия')
+    parser.add_argument('--head', default=None, help='конечная ревизия (по умолчанию рабочий каталог)')
+    parser.add_argument('--include', action='append', default=None,
+                        help=f'шаблон анализируемых файлов (по умолчанию {" ".join(DEFAULT_INCLUDE)})')
+    parser.add_argument('--exclude', action='append', default=[], help='шаблон исключаемых файлов и каталогов')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help='формат результатов')
+    parser.add_argument('-o', '--output', help='файл результатов (по умолчанию stdout)')
+    parser.add_argument('--model', default=DEFAULT_MODEL_FILE, help='файл обученной модели')
+
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.model):
+        parser.error(f'there is no model file {args.model}, do fit before scan')
+    args.include = args.include or DEFAULT_INCLUDE
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    output = open(args.output, 'w', encoding='utf8', newline='') if args.output else sys.stdout
+
+    start_time = time.perf_counter()
+    try:
+        files_cnt, functions_cnt = diffscan(args.repo, args.base, args.head, args.model,
+                                            DiffWriter(output, args.format), args.include, args.exclude)
+    except subprocess.CalledProcessError as e:
+        print(f'git failed: {e.stderr.decode("utf8", errors="replace").strip()}', file=sys.stderr)
+        return 2
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start_time
+
+    print(f'files = {files_cnt}, functions = {functions_cnt}, time = {elapsed:.2f} s', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Клиент локального сервиса src.daemon для pre-commit и редакторов:
+python -m src.hook FILE... [--url http://127.0.0.1:8737] [--threshold 0.8] [--timeout S]
+
+Выводит функции с вероятностью дефектов не меньше порога в виде file:start-end: proba,
+код возврата равен 1, если такие функции есть. Импортирует только стандартную библиотеку,
+чтобы запуск занимал десятки миллисекунд; если сервис не запущен, проверка пропускается
+"""
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+
+DEFAULT_URL = 'http://127.0.0.1:8737'
+THRESHOLD = 0.8
+TIMEOUT = 30.
+
+
+def analyze(code: str, url: str = DEFAULT_URL, timeout: float = TIMEOUT) -> list[dict]:
+    request = urllib.request.Request(f'{url}/analyze', data=json.dumps({'code': code}).encode('utf8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())['functions']
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.hook', description='Проверка файлов локальным сервисом')
+    parser.add_argument('files', nargs='*', help='проверяемые файлы')
+    parser.add_argument('--url', default=DEFAULT_URL, help='адрес сервиса src.daemon')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='порог вероятности дефектов')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help='время ожидания ответа, секунды')
+    args = parser.parse_args(argv)
+
+    found = False
+    for path in args.files:
+        with open(path, encoding='utf8', errors='replace') as f:
+            code = f.read()
+
+        try:
+            functions = analyze(code, args.url, args.timeout)
+        except urllib.error.HTTPError as e:
+            print(f'{path}: {e.code} {e.read().decode("utf8", errors="replace")}', file=sys.stderr)
+            return 2
+        except OSError as e:
+            # Проверка пропускается, только если сервис не запущен; сброс соединения или истечение
+            # времени ожидания означают, что файл не проверен
+            if isinstance(getattr(e, 'reason', e), ConnectionRefusedError):
+                print(f'There is no defects service at {args.url}, check is skipped', file=sys.stderr)
+                return 0
+            print(f'{path}: defects service at {args.url} failed: {getattr(e, "reason", e)}', file=sys.stderr)
+            return 2
+
+        for function in functions:
+            if function['defects_proba'] >= args.threshold:
+                found = True
+                print(f'{path}:{function["start_line"]}-{function["end_line"]}: {function["defects_proba"]:.2f}')
+
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
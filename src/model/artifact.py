@@ -0,0 +1,77 @@
+import hashlib
+import json
+import numpy as np
+import pickle
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # XGBoost вместе со своими необязательными зависимостями импортируется долго, поэтому только при загрузке модели
+    from xgboost import Booster
+
+# Версия формата файла модели, увеличивается при изменении состава сохраняемых сведений
+ARTIFACT_VERSION = 1
+
+
+def file_digest(model_file: str) -> str:
+    # Хэш содержимого файла модели, не требует загрузки XGBoost
+    digest = hashlib.blake2b(digest_size=16)
+    with open(model_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelArtifact:
+    """
+    Обученная модель вместе со всем, что нужно для предсказания: порядком признаков и
+    параметрами стандартизации. Хранится одним файлом в собственном формате XGBoost (.ubj или .json),
+    дополнительные сведения записываются в атрибуты бустера
+    """
+    def __init__(self, booster: 'Booster', features: list[str],
+                 mean: np.ndarray | None = None, scale: np.ndarray | None = None):
+        self.booster = booster
+        self.features = list(features)
+        # Параметры стандартизации хранятся в float64, как у StandardScaler при обучении: признаки — целые
+        # значения, и при вычислении в float32 часть из них попадала бы по другую сторону порогов деревьев
+        self.mean = np.zeros(len(features)) if mean is None else np.asarray(mean, np.float64)
+        self.scale = np.ones(len(features)) if scale is None else np.asarray(scale, np.float64)
+
+    def save(self, model_file: str):
+        self.booster.set_attr(
+            artifact_version=str(ARTIFACT_VERSION),
+            features=json.dumps(self.features),
+            scaler_mean=json.dumps(self.mean.tolist()),
+            scaler_scale=json.dumps(self.scale.tolist()),
+        )
+        self.booster.save_model(model_file)
+
+    @classmethod
+    def load(cls, model_file: str, default_features: list[str]) -> 'ModelArtifact':
+        if model_file.endswith('.pkl'):
+            # Модель прежнего формата: XGBClassifier, сохранённый pickle, без параметров стандартизации
+            with open(model_file, 'rb') as f:
+                return cls(pickle.load(f).get_booster(), default_features)
+
+        from xgboost import Booster
+        booster = Booster(model_file=model_file)
+        version = booster.attr('artifact_version')
+        if version is None:
+            return cls(booster, default_features)
+        if int(version) > ARTIFACT_VERSION:
+            raise ValueError(f'Model file version {version} is not supported, expected {ARTIFACT_VERSION}')
+
+        return cls(booster, json.loads(booster.attr('features')),
+                   json.loads(booster.attr('scaler_mean')), json.loads(booster.attr('scaler_scale')))
+
+    def to_matrix(self, X) -> np.ndarray:
+        # Столбцы таблицы переставляются в порядок, в котором модель обучалась
+        if hasattr(X, 'columns') and set(self.features) <= set(X.columns):
+            X = X[self.features]
+        return np.asarray(X, dtype=np.float32)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Вероятности наличия дефектов для строк матрицы признаков (столбцы в порядке features),
+        стандартизация выполняется одной векторной операцией в float64, как при обучении
+        """
+        return self.booster.inplace_predict(((X - self.mean) / self.scale).astype(np.float32))
@@ -1,2 +1,14 @@
 SEED = 123
 GRAPHICS = True
+
+# Сетка гиперпараметров для поиска лучшей модели
+SEARCH_GRID = {
+    'learning_rate': [0.01, 0.02, 0.03, 0.04, 0.05],
+    'max_depth': [3, 4, 5, 6, 7],
+    'n_estimators': [800, 900, 1000]
+}
+
+# Порядок признаков, в котором обучается модель (порядок столбцов jm1.arff).
+# В наборе данных PROMISE столбец lOCodeAndComment называется locCodeAndComment
+FEATURES = ['loc', 'v(g)', 'n', 'v', 'd', 'i', 'e', 'b', 't', 'lOCode', 'lOComment',
+            'lOBlank', 'lOCodeAndComment', 'uniq_Op', 'uniq_Opnd', 'total_Op', 'total_Opnd']
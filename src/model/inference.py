@@ -0,0 +1,142 @@
+"""
+Предсказание вероятностей дефектов обученной моделью без зависимостей обучения
+(matplotlib, sklearn.model_selection, загрузка PROMISE), XGBoost импортируется при первой загрузке модели.
+Обучение и поиск гиперпараметров — в model.GBDDModel
+"""
+import numpy as np
+import os
+import threading
+from typing import Iterable
+from src.model.artifact import ModelArtifact, file_digest
+from src.model.config import FEATURES
+from src.processing.profiling import PROFILER, timed
+
+
+class ModelCache:
+    """
+    Кэш загруженных моделей, общий для нескольких экземпляров GBDDPredictor.
+    Файл модели перечитывается только при изменении времени модификации или размера
+    """
+    def __init__(self):
+        self.__models: dict[str, tuple[tuple[int, int], ModelArtifact]] = {}
+        self.__lock = threading.Lock()
+
+    def get(self, model_file: str) -> ModelArtifact:
+        path = os.path.abspath(model_file)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self.__lock:
+            cached = self.__models.get(path)
+            if cached is not None and cached[0] == version:
+                PROFILER.increment('model.cache_hits')
+                return cached[1]
+
+            PROFILER.increment('model.cache_misses')
+            model = ModelArtifact.load(path, FEATURES)
+            self.__models[path] = (version, model)
+            return model
+
+    def invalidate(self, model_file: str | None = None):
+        with self.__lock:
+            if model_file is None:
+                self.__models.clear()
+            else:
+                self.__models.pop(os.path.abspath(model_file), None)
+
+
+MODEL_CACHE = ModelCache()
+
+
+class GBDDPredictor:
+    def __init__(self, model_file: str = r'..\app\model.ubj', cache: ModelCache = MODEL_CACHE):
+        self.__model_file = model_file
+        self.__cache = cache
+        # Буфер строки признаков для predict_proba_one, свой в каждом потоке
+        self.__local = threading.local()
+
+    @property
+    def model_file(self) -> str:
+        return self.__model_file
+
+    def model_digest(self) -> str:
+        # Ключ результатов модели в cache.FunctionCache
+        return file_digest(self.__model_file)
+
+    def invalidate(self):
+        # Вызывается после сохранения новой модели в model_file
+        self.__cache.invalidate(self.__model_file)
+
+    @timed('model.read_model')
+    def __read_model(self) -> ModelArtifact:
+        try:
+            return self.__cache.get(self.__model_file)
+        except FileNotFoundError:
+            print('Do fit before predict, there is no model file')
+
+    def predict(self, X_test) -> list[float]:
+        model = self.__read_model()
+        return (model.predict_proba(model.to_matrix(X_test)) >= 0.5).astype(int)
+
+    @timed('model.predict_proba')
+    def predict_proba(self, X_test) -> list[list[float]]:
+        model = self.__read_model()
+        PROFILER.increment('model.predicted_rows', len(X_test))
+        defects_proba = model.predict_proba(model.to_matrix(X_test))
+        return np.column_stack([1. - defects_proba, defects_proba])
+
+    def predict_proba_one(self, metrics: dict[str, int | float] | np.ndarray, features: list[str] = FEATURES) -> float:
+        """
+        Вероятность наличия дефектов одной функции с наименьшей задержкой: без pandas и обёрток sklearn.
+        metrics — словарь метрик (MetricsCppCode.count) или строка признаков в порядке features.
+        Признаки записываются в переиспользуемые буферы (стандартизация в float64, как в ModelArtifact.predict_proba)
+        и передаются напрямую в Booster.inplace_predict
+        """
+        model = self.__read_model()
+        row = getattr(self.__local, 'row', None)
+        if row is None or row.shape[1] != len(model.features):
+            row = self.__local.row = np.empty((1, len(model.features)), dtype=np.float64)
+            self.__local.row32 = np.empty((1, len(model.features)), dtype=np.float32)
+        row32 = self.__local.row32
+
+        if isinstance(metrics, dict):
+            for idx, feature in enumerate(model.features):
+                row[0, idx] = metrics[feature]
+        elif features is model.features or features == model.features:
+            row[0] = metrics
+        else:
+            row[0] = np.asarray(metrics)[[features.index(feature) for feature in model.features]]
+
+        np.subtract(row, model.mean, out=row)
+        np.divide(row, model.scale, out=row)
+        np.copyto(row32, row, casting='same_kind')
+        return float(model.booster.inplace_predict(row32)[0])
+
+    @timed('model.predict_proba_batch')
+    def predict_proba_batch(self, metrics: Iterable[dict[str, int | float]]) -> np.ndarray:
+        """
+        Вероятности наличия дефектов для набора функций, вычисленные одним вызовом модели.
+        Столбцы матрицы признаков упорядочены так же, как при обучении
+        """
+        model = self.__read_model()
+        X_test = np.array([[values[feature] for feature in model.features] for values in metrics], dtype=np.float32)
+        if not len(X_test):
+            return np.empty(0, dtype=np.float32)
+
+        PROFILER.increment('model.predicted_rows', len(X_test))
+        return model.predict_proba(X_test)
+
+    @timed('model.predict_proba_matrix')
+    def predict_proba_matrix(self, X_test: np.ndarray, features: list[str] = FEATURES) -> np.ndarray:
+        """
+        Вероятности наличия дефектов для готовой матрицы признаков (например, halstead.MetricsBatch.to_matrix),
+        столбцы которой соответствуют features
+        """
+        model = self.__read_model()
+        if not len(X_test):
+            return np.empty(0, dtype=np.float32)
+
+        if features != model.features:
+            X_test = X_test[:, [features.index(feature) for feature in model.features]]
+        PROFILER.increment('model.predicted_rows', len(X_test))
+        return model.predict_proba(X_test)
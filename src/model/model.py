@@ -2,21 +2,29 @@ import sys
 sys.path.append('../..')
 
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
+import os
 import pandas as pd
-import pickle
-from sklearn.metrics import f1_score, accuracy_score, precision_score, recall_score
-from src.model.config import SEED
-from sklearn.model_selection import GridSearchCV, StratifiedKFold
-from src.processing.promise import PromiseDataset
+import time
+import xgboost as xgb
+from sklearn.base import clone
+from sklearn.metrics import f1_score, accuracy_score, precision_score, recall_score, roc_auc_score
+from src.model.config import FEATURES, SEARCH_GRID, SEED
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from sklearn.preprocessing import StandardScaler
+from src.model.artifact import ModelArtifact
+from src.model.inference import MODEL_CACHE, GBDDPredictor, ModelCache
 from xgboost import XGBClassifier
 
 
 # Gradient Boosting Defect Detection Model
-class GBDDModel:
+class GBDDModel(GBDDPredictor):
+    """
+    Обучение и поиск гиперпараметров, методы предсказания наследуются от GBDDPredictor.
+    Для предсказания без зависимостей обучения достаточно GBDDPredictor (src.model.inference)
+    """
     def __init__(self, learning_rate: float = 0.01, n_estimators: int = 1000, max_depth: int = 7,
-                 model_file: str = r'..\app\model.pkl'):
+                 model_file: str = r'..\app\model.ubj', cache: ModelCache = MODEL_CACHE):
+        super().__init__(model_file, cache)
         self.__model: XGBClassifier = XGBClassifier(
             learning_rate=learning_rate,
             n_estimators=n_estimators,
@@ -25,21 +33,115 @@ class GBDDModel:
             eval_metric='logloss',
         )
 
-        self.__model_file = model_file
+    def grid_search(self, X_train: pd.DataFrame, y_train: pd.DataFrame,
+                    graphics: bool = False) -> dict[str, int | float]:
+        """
+        Поиск по сетке SEARCH_GRID. Для каждого сочетания learning_rate и max_depth на каждом разбиении
+        обучается одна модель с наибольшим n_estimators, меньшие значения n_estimators оцениваются
+        по первым деревьям этой же модели (iteration_range)
+        """
+        X_train, y_train = np.asarray(X_train), np.asarray(y_train)
+        folds = list(StratifiedKFold(n_splits=5, shuffle=True, random_state=SEED).split(X_train, y_train))
+        n_estimators_grid = sorted(SEARCH_GRID['n_estimators'])
+        if graphics:
+            plt = use_pyplot()
 
-    def grid_search(self, X_train: pd.DataFrame, y_train: pd.DataFrame):
-        skf = StratifiedKFold(n_splits=5, shuffle=True, random_state=SEED)
-        params = {
-            'learning_rate': [0.01, 0.02, 0.03, 0.04, 0.05],
-            'max_depth': [3, 4, 5, 6, 7],
-            'n_estimators': [800, 900, 1000]
+        best_score, best_params = -1., {}
+        for params in ParameterGrid({name: SEARCH_GRID[name] for name in ['learning_rate', 'max_depth']}):
+            scores = np.zeros((len(folds), len(n_estimators_grid)))
+            losses: list[list[float]] = []
+
+            for fold, (train_idx, test_idx) in enumerate(folds):
+                model = clone(self.__model).set_params(**params, n_estimators=n_estimators_grid[-1],
+                                                       n_jobs=os.cpu_count())
+                model.fit(X_train[train_idx], y_train[train_idx],
+                          eval_set=[(X_train[test_idx], y_train[test_idx])], verbose=False)
+                for idx, n_estimators in enumerate(n_estimators_grid):
+                    y_proba = model.predict_proba(X_train[test_idx], iteration_range=(0, n_estimators))[:, 1]
+                    scores[fold, idx] = roc_auc_score(y_train[test_idx], y_proba)
+                losses.append(model.evals_result()['validation_0']['logloss'])
+
+            for n_estimators, score in zip(n_estimators_grid, scores.mean(axis=0)):
+                print(f'{params}, n_estimators={n_estimators}: score={score:.3f}')
+                if score > best_score:
+                    best_score, best_params = score, {**params, 'n_estimators': n_estimators}
+
+            if graphics:
+                plt.plot(np.mean(losses, axis=0), label=', '.join(f'{name}={value}' for name, value in params.items()))
+
+        print(best_score)
+        print(best_params)
+
+        if graphics:
+            plt.xlabel('Итерация')
+            plt.ylabel('Функция потерь')
+            plt.legend()
+            plt.show()
+
+        return best_params
+
+    @staticmethod
+    def halving_search(X_train: pd.DataFrame, y_train: pd.DataFrame, eta: int = 3, min_rounds: int = 100,
+                       early_stopping_rounds: int = 50) -> dict[str, int | float]:
+        """
+        Поиск гиперпараметров последовательным отсевом (successive halving): все сочетания
+        learning_rate и max_depth обучаются на min_rounds деревьях, в следующий этап проходит лучшая
+        1 / eta часть сочетаний, а число деревьев увеличивается в eta раз (до наибольшего n_estimators сетки).
+        Для каждого разбиения кросс-валидации обучающая и проверочная QuantileDMatrix строятся один раз
+        (проверочная квантуется по границам обучающей) и используются всеми сочетаниями на всех этапах.
+        Каждое сочетание обучается методом hist с ранней остановкой по проверочной части, оценка — средний
+        ROC AUC по разбиениям, число деревьев — среднее число деревьев, найденное ранней остановкой
+        """
+        n_jobs = os.cpu_count() or 1
+        max_rounds = max(SEARCH_GRID['n_estimators'])
+        X_train, y_train = np.asarray(X_train, dtype=np.float32), np.asarray(y_train)
+        fold_matrices: list[tuple[xgb.QuantileDMatrix, xgb.QuantileDMatrix]] = []
+        for train_idx, test_idx in StratifiedKFold(n_splits=5, shuffle=True, random_state=SEED).split(X_train, y_train):
+            fold_train = xgb.QuantileDMatrix(X_train[train_idx], label=y_train[train_idx], nthread=n_jobs)
+            fold_test = xgb.QuantileDMatrix(X_train[test_idx], label=y_train[test_idx], ref=fold_train, nthread=n_jobs)
+            fold_matrices.append((fold_train, fold_test))
+        base_params = {
+            'objective': 'binary:logistic',
+            'eval_metric': 'auc',
+            'tree_method': 'hist',
+            'nthread': n_jobs,
+            'seed': SEED,
         }
-        search = GridSearchCV(self.__model, param_grid=params, scoring='roc_auc', n_jobs=4,
-                              cv=skf.split(X_train, y_train), verbose=3)
-        search.fit(X_train, y_train)
-        print(search.best_score_)
-        print(search.best_estimator_)
-        print(search.best_params_)
+
+        candidates = list(ParameterGrid({name: SEARCH_GRID[name] for name in ['learning_rate', 'max_depth']}))
+        rounds = min(min_rounds, max_rounds)
+        while True:
+            trials: list[tuple[float, dict[str, int | float]]] = []
+            for params in candidates:
+                start_time = time.perf_counter()
+                scores: list[float] = []
+                best_rounds: list[int] = []
+                for fold_train, fold_test in fold_matrices:
+                    booster = xgb.train({**base_params, **params}, fold_train, num_boost_round=rounds,
+                                        evals=[(fold_test, 'test')], early_stopping_rounds=early_stopping_rounds,
+                                        verbose_eval=False)
+                    scores.append(booster.best_score)
+                    best_rounds.append(booster.best_iteration + 1)
+                trial_time = time.perf_counter() - start_time
+
+                score = float(np.mean(scores))
+                n_estimators = int(round(np.mean(best_rounds)))
+                trials.append((score, {**params, 'n_estimators': n_estimators}))
+                print(f'rounds={rounds}, {params}, n_estimators={n_estimators}: '
+                      f'score={score:.4f}, time={trial_time:.1f}s')
+
+            trials.sort(key=lambda trial: trial[0], reverse=True)
+            if len(candidates) == 1 or rounds >= max_rounds:
+                break
+            candidates = [params for _, params in trials[:max(1, len(candidates) // eta)]]
+            for params in candidates:
+                params.pop('n_estimators')
+            rounds = min(rounds * eta, max_rounds)
+
+        best_score, best_params = trials[0]
+        print(best_score)
+        print(best_params)
+        return best_params
 
     def debug_fit(self, X_train: pd.DataFrame, y_train: pd.DataFrame, X_test: pd.DataFrame, y_test: pd.DataFrame):
         defect_classes = y_train.value_counts()
@@ -49,37 +151,37 @@ class GBDDModel:
 
         y_pred = self.__model.predict(X_test)
         print(get_statistics(y_test, y_pred))
-        columns = ['loc', 'v(g)', 'n', 'v', 'd', 'i', 'e', 'b', 't', 'lOCode', 'lOComment',
-                   'lOBlank', 'locCodeAndComment', 'uniq_Op', 'uniq_Opnd', 'total_Op', 'total_Opnd']
-        for feature, importance in zip(columns, self.__model.feature_importances_):
+        for feature, importance in zip(FEATURES, self.__model.feature_importances_):
             print(f'{feature}: {importance}')
 
         results = self.__model.evals_result()
-        matplotlib.use('Qt5Agg')
+        plt = use_pyplot()
         plt.plot(results['validation_1']['logloss'])
         plt.xlabel('Итерация')
         plt.ylabel('Функция потерь')
         plt.show()
 
-    def fit(self, X_train: pd.DataFrame, y_train: pd.DataFrame):
+    def fit(self, X_train: pd.DataFrame, y_train: pd.DataFrame, scaler: StandardScaler | None = None):
+        """
+        Обучение и сохранение модели на исходных метриках (например, PromiseDataset.prepare).
+        Стандартизация scaler (PromiseDataset.scaler) выполняется здесь и сохраняется в файле модели,
+        поэтому predict и predict_proba также принимают исходные, не стандартизированные метрики
+        """
+        X_train = pd.DataFrame(X_train, columns=FEATURES) if not hasattr(X_train, 'columns') else X_train[FEATURES]
+        if scaler is not None:
+            X_train = scaler.transform(X_train)
         self.__model.fit(X_train, y_train)
-        with open(self.__model_file, 'wb') as f:
-            pickle.dump(self.__model, f)
-
-    def __read_model(self):
-        try:
-            with open(self.__model_file, 'rb') as f:
-                return pickle.load(f)
-        except FileNotFoundError:
-            print('Do fit before predict, there is no model file')
-
-    def predict(self, X_test: pd.DataFrame) -> list[float]:
-        model = self.__read_model()
-        return model.predict(X_test)
-
-    def predict_proba(self, X_test: pd.DataFrame) -> list[list[float]]:
-        model = self.__read_model()
-        return model.predict_proba(X_test)
+        mean, scale = (scaler.mean_, scaler.scale_) if scaler is not None else (None, None)
+        ModelArtifact(self.__model.get_booster(), FEATURES, mean, scale).save(self.model_file)
+        self.invalidate()
+
+
+def use_pyplot():
+    # matplotlib нужен только для графиков обучения и импортируется при первом построении
+    import matplotlib
+    import matplotlib.pyplot as plt
+    matplotlib.use('Qt5Agg')
+    return plt
 
 
 def get_statistics(y_test: pd.DataFrame, y_pred: np.array):
@@ -0,0 +1,127 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable
+from src.processing.metircs import METRICS_VERSION
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'gbdd', 'functions.sqlite')
+MAX_ENTRIES = 1_000_000
+# Количество параметров одного запроса (ограничение SQLite на число параметров)
+QUERY_SIZE = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS functions (
+    function_hash TEXT NOT NULL,
+    metrics_version INTEGER NOT NULL,
+    model_digest TEXT NOT NULL,
+    counts TEXT NOT NULL,
+    defects_proba REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (function_hash, metrics_version, model_digest)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS functions_last_used ON functions (last_used);
+'''
+
+
+class FunctionCache:
+    """
+    Постоянный кэш метрик (значений COUNT_FEATURES) и вероятностей дефектов функций.
+    Ключ — хэш нормализованного текста функции (functions.function_hash), версия вычисления метрик
+    и хэш файла модели, поэтому изменение кода метрик или переобучение модели не приводят к устаревшим результатам.
+    SQLite в режиме WAL позволяет одновременно читать и записывать из нескольких процессов,
+    при превышении max_entries удаляются давно не использованные записи
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_FILE, max_entries: int = MAX_ENTRIES):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.__max_entries = max_entries
+        # Оценка количества записей сверху (вставки с заменой тоже учитываются), точное значение
+        # вычисляется при первой записи и перед вытеснением, а не при каждой вставке
+        self.__entries_cnt: int | None = None
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, timeout=30., isolation_level=None, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__connection.executescript(SCHEMA)
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def get_many(self, function_hashes: Iterable[str],
+                 model_digest: str) -> dict[str, tuple[tuple[int, ...], float]]:
+        """Найденные в кэше функции: хэш -> (значения COUNT_FEATURES, вероятность дефектов)"""
+        function_hashes = list(dict.fromkeys(function_hashes))
+        found: dict[str, tuple[tuple[int, ...], float]] = {}
+
+        with self.__lock:
+            for start in range(0, len(function_hashes), QUERY_SIZE):
+                part = function_hashes[start:start + QUERY_SIZE]
+                placeholders = ', '.join('?' * len(part))
+                rows = self.__connection.execute(
+                    f'SELECT function_hash, counts, defects_proba FROM functions '
+                    f'WHERE metrics_version = ? AND model_digest = ? AND function_hash IN ({placeholders})',
+                    [METRICS_VERSION, model_digest, *part],
+                ).fetchall()
+                for function_hash, counts, defects_proba in rows:
+                    found[function_hash] = (tuple(json.loads(counts)), defects_proba)
+
+            # Время последнего использования обновляется одной транзакцией для всех найденных записей
+            if found:
+                now = time.time()
+                self.__connection.execute('BEGIN')
+                try:
+                    self.__connection.executemany(
+                        'UPDATE functions SET last_used = ? '
+                        'WHERE function_hash = ? AND metrics_version = ? AND model_digest = ?',
+                        [(now, function_hash, METRICS_VERSION, model_digest) for function_hash in found],
+                    )
+                    self.__connection.execute('COMMIT')
+                except BaseException:
+                    self.__connection.execute('ROLLBACK')
+                    raise
+
+        return found
+
+    def put_many(self, entries: Iterable[tuple[str, tuple[int, ...], float]], model_digest: str):
+        """entries — (хэш функции, значения COUNT_FEATURES, вероятность дефектов)"""
+        now = time.time()
+        rows = [(function_hash, METRICS_VERSION, model_digest, json.dumps(list(counts)), float(defects_proba), now)
+                for function_hash, counts, defects_proba in entries]
+        if not rows:
+            return
+
+        with self.__lock:
+            self.__connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.__connection.executemany('INSERT OR REPLACE INTO functions VALUES (?, ?, ?, ?, ?, ?)', rows)
+                if self.__entries_cnt is None:
+                    self.__entries_cnt = self.__count_entries()
+                else:
+                    self.__entries_cnt += len(rows)
+                self.__evict()
+                self.__connection.execute('COMMIT')
+            except BaseException:
+                self.__entries_cnt = None
+                self.__connection.execute('ROLLBACK')
+                raise
+
+    def __count_entries(self) -> int:
+        return self.__connection.execute('SELECT COUNT(*) FROM functions').fetchone()[0]
+
+    def __evict(self):
+        # Удаляются лишние записи и ещё десятая часть max_entries, чтобы вытеснение не выполнялось при каждой вставке
+        if self.__entries_cnt <= self.__max_entries:
+            return
+        self.__entries_cnt = self.__count_entries()
+        if self.__entries_cnt <= self.__max_entries:
+            return
+        excess = self.__entries_cnt - self.__max_entries + self.__max_entries // 10
+        deleted = self.__connection.execute(
+            'DELETE FROM functions WHERE (function_hash, metrics_version, model_digest) IN '
+            '(SELECT function_hash, metrics_version, model_digest FROM functions ORDER BY last_used LIMIT ?)', [excess]
+        ).rowcount
+        self.__entries_cnt -= deleted
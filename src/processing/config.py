@@ -1,2 +1,5 @@
 SEED = 1
 PROMISE_URL = 'http://promise.site.uottawa.ca/SERepository/datasets/'
+
+# Функции большего размера исключаются из обучающей выборки, None — без ограничения
+MAX_LOC = None
@@ -0,0 +1,251 @@
+import hashlib
+import re
+from typing import Iterator, NamedTuple
+from src.processing.lines import LineIndex
+from src.processing.profiling import PROFILER, timed
+
+
+SCAN_PATTERN = re.compile(r'''
+    (?P<comment>//[^\n]*|/\*[\s\S]*?(?:\*/|\Z))
+  | (?P<string>"(?:\\[\s\S]|[^"\\\n])*"?)
+  | (?P<char>'(?:\\[\s\S]|[^'\\\n])*'?)
+  | (?P<directive>^[ \t]*\#(?:\\\n|[^\n])*)
+  | (?P<brace>[{};])
+''', re.VERBOSE | re.MULTILINE)
+
+OPERATOR_NAME_PATTERN = re.compile(r'\boperator\b\s*(?:\(\)|\[\]|[^\w\s(]+|\w+)\s*$')
+
+QUALIFIERS = frozenset(['const', 'volatile', 'noexcept', 'override', 'final', 'mutable', '&', '&&'])
+NOT_FUNCTION_NAMES = frozenset(['if', 'for', 'while', 'switch', 'catch', 'return', 'sizeof', 'alignof',
+                                'decltype', 'typeid', 'new', 'delete', 'throw', 'else', 'do', 'try'])
+NAME_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_:~')
+TYPE_CHARS = NAME_CHARS | frozenset('<>*&')
+
+
+class Function(NamedTuple):
+    """
+    Функция, найденная в тексте программы:
+    start_line, end_line — номера первой и следующей за последней строк (с нуля),
+    start_offset, end_offset — смещения начала и конца функции в тексте
+    """
+    start_line: int
+    end_line: int
+    start_offset: int
+    end_offset: int
+    text: str
+
+
+def _is_name_char(char: str, chars: frozenset[str]) -> bool:
+    return char in chars or char.isalpha()
+
+
+def _strip_qualifiers(header: str, end: int) -> int:
+    # Квалификаторы после списка параметров: void foo() const noexcept {
+    while True:
+        end = _skip_spaces(header, end)
+        start = end
+        while start > 0 and (_is_name_char(header[start - 1], NAME_CHARS) or header[start - 1] == '&'):
+            start -= 1
+        if start == end or header[start:end] not in QUALIFIERS:
+            return end
+        end = start
+
+
+def _skip_spaces(header: str, end: int) -> int:
+    while end > 0 and header[end - 1].isspace():
+        end -= 1
+    return end
+
+
+def _find_name_start(header: str, end: int) -> int:
+    start = end
+    while start > 0 and _is_name_char(header[start - 1], NAME_CHARS):
+        start -= 1
+    # Двоеточие без пробела перед именем — начало списка инициализации (A() :a(0)), а не часть имени A::a
+    if header.startswith(':', start) and not header.startswith('::', start):
+        start += 1
+    return start
+
+
+def _find_call(header: str, end: int) -> int | None:
+    """
+    Начало имени перед списком аргументов, который заканчивается в позиции end,
+    None, если перед позицией нет списка аргументов в скобках с корректным именем
+    """
+    if end == 0 or header[end - 1] != ')':
+        return None
+
+    depth = 0
+    position = end - 1
+    while position >= 0:
+        if header[position] == ')':
+            depth += 1
+        elif header[position] == '(':
+            depth -= 1
+            if depth == 0:
+                break
+        position -= 1
+    if position < 0:
+        return None
+
+    name_end = _skip_spaces(header, position)
+    operator_name = OPERATOR_NAME_PATTERN.search(header, max(name_end - 64, 0), name_end)
+    if operator_name is not None:
+        return operator_name.start()
+
+    name_start = _find_name_start(header, name_end)
+    name = header[name_start:name_end]
+    if not name or name in NOT_FUNCTION_NAMES or name[0].isdigit():
+        return None
+    return name_start
+
+
+def _find_signature(header: str) -> int | None:
+    """
+    Начало сигнатуры функции в заголовке (тексте перед открывающей фигурной скобкой),
+    None, если заголовок не является заголовком функции
+    """
+    name_start = _find_call(header, _strip_qualifiers(header, len(header)))
+    if name_start is None:
+        return None
+
+    # Список инициализации конструктора: A(int x) : a(x), b(0) {
+    while True:
+        previous = _skip_spaces(header, name_start)
+        if previous > 0 and header[previous - 1] == ',':
+            initializer_start = _find_call(header, _skip_spaces(header, previous - 1))
+            if initializer_start is None:
+                break
+            name_start = initializer_start
+        elif previous > 1 and header[previous - 1] == ':' and header[previous - 2] != ':':
+            constructor_start = _find_call(header, _strip_qualifiers(header, previous - 1))
+            if constructor_start is not None:
+                name_start = constructor_start
+            break
+        else:
+            break
+
+    # Возвращаемый тип перед именем функции (у конструкторов и деструкторов его нет)
+    type_end = name_start
+    while type_end > 0 and (header[type_end - 1].isspace() or header[type_end - 1] in '*&'):
+        type_end -= 1
+    type_start = type_end
+    while type_start > 0 and _is_name_char(header[type_start - 1], TYPE_CHARS):
+        type_start -= 1
+
+    return_type = header[type_start:type_end]
+    if type_end == name_start or not return_type or return_type in NOT_FUNCTION_NAMES or \
+            (return_type.endswith(':') and not return_type.endswith('::')):
+        return name_start
+    return type_start
+
+
+def _is_member_initializer(header: str) -> bool:
+    """
+    Заканчивается ли заголовок именем в списке инициализации конструктора, после которого
+    идёт инициализация в фигурных скобках: A(int x) : a{x}, b{0} {
+    """
+    name_end = _skip_spaces(header, len(header))
+    name_start = _find_name_start(header, name_end)
+    if name_start == name_end or header[name_start].isdigit():
+        return False
+
+    previous = _skip_spaces(header, name_start)
+    if previous > 0 and header[previous - 1] == ',':
+        return _find_call(header, _skip_spaces(header, previous - 1)) is not None
+    if previous > 1 and header[previous - 1] == ':' and header[previous - 2] != ':':
+        return _find_call(header, _strip_qualifiers(header, previous - 1)) is not None
+    return False
+
+
+def extract_functions(code: str) -> Iterator[Function]:
+    """
+    Поиск определений функций на любом уровне вложенности (в пространствах имён, классах)
+    за один проход по тексту с учётом строк, символьных литералов, комментариев и директив препроцессора
+    """
+    line_index = LineIndex(code)
+    header_start = 0
+    header_masks: list[tuple[int, int, str]] = []
+    function_start = -1
+    depth = 0
+    # Начало инициализатора в фигурных скобках в списке инициализации конструктора
+    initializer_start = -1
+
+    for match in SCAN_PATTERN.finditer(code):
+        kind = match.lastgroup
+        start, end = match.span()
+
+        if kind != 'brace':
+            # Литералы и комментарии в заголовке заменяются пробелами, чтобы не мешать разбору сигнатуры
+            if function_start < 0 and initializer_start < 0:
+                masked = ' ' * (end - start)
+                if kind == 'string' or kind == 'char':
+                    masked = code[start] + masked[2:] + code[end - 1] if end - start > 1 else code[start]
+                header_masks.append((start, end, masked))
+            continue
+
+        brace = match.group()
+        if function_start >= 0:
+            if brace == '{':
+                depth += 1
+            elif brace == '}':
+                depth -= 1
+                if depth == 0:
+                    yield Function(line_index.line_of(function_start), line_index.line_of(end) + 1,
+                                   function_start, end, code[function_start:end])
+                    function_start = -1
+                    header_start = end
+                    header_masks = []
+            continue
+
+        if initializer_start >= 0:
+            if brace == '{':
+                depth += 1
+            elif brace == '}':
+                depth -= 1
+                if depth == 0:
+                    # Для разбора сигнатуры a{x} не отличается от a(x)
+                    header_masks.append((initializer_start, end, '(' + ' ' * (end - initializer_start - 2) + ')'))
+                    initializer_start = -1
+            continue
+
+        if brace == '{':
+            parts: list[str] = []
+            position = header_start
+            for mask_start, mask_end, masked in header_masks:
+                parts.append(code[position:mask_start])
+                parts.append(masked)
+                position = mask_end
+            parts.append(code[position:start])
+
+            header = ''.join(parts)
+            signature_start = _find_signature(header)
+            if signature_start is not None:
+                function_start = header_start + signature_start
+                depth = 1
+                continue
+            if _is_member_initializer(header):
+                initializer_start = start
+                depth = 1
+                continue
+
+        # Пространства имён, классы и инициализаторы: поиск функций продолжается внутри них
+        header_start = end
+        header_masks = []
+
+
+@timed('functions.extract')
+def find_functions(code: str) -> list[Function]:
+    # Все функции текста сразу: время поиска замеряется без учёта обработки найденных функций
+    functions = list(extract_functions(code))
+    PROFILER.increment('functions.found', len(functions))
+    return functions
+
+
+def function_hash(text: str) -> str:
+    """
+    Хэш нормализованного текста функции: завершающие пробелы и вид переводов строк
+    на значения метрик не влияют, поэтому не учитываются
+    """
+    normalized = '\n'.join(line.rstrip() for line in text.split('\n'))
+    return hashlib.blake2b(normalized.encode('utf8'), digest_size=16).hexdigest()
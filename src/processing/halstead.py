@@ -0,0 +1,79 @@
+import numpy as np
+from src.processing.metircs import COUNT_FEATURES, MetricsCppCode
+
+DERIVED_FEATURES = ['n', 'v', 'd', 'i', 'e', 'b', 't']
+# Метрики с дробными значениями, остальные — целые числа
+FLOAT_FEATURES = frozenset(DERIVED_FEATURES) - {'n'}
+
+
+def _round(values: np.ndarray, decimals: int = 2) -> np.ndarray:
+    """
+    Округление, совпадающее со встроенным round: np.round умножает значение на 10^decimals,
+    поэтому для чисел, близких к середине между соседними значениями, округление выполняется по одному
+    """
+    rounded = np.round(values, decimals)
+    scaled = values * 10 ** decimals
+    for idx in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+        rounded[idx] = round(float(values[idx]), decimals)
+    return rounded
+
+
+def derive_halsted(counts: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Метрики Холстеда для матрицы значений COUNT_FEATURES (строка — функция),
+    вычисленные векторно, с теми же формулами и округлением, что и в MetricsCppCode.count_n_metrics
+    """
+    columns = {feature: counts[:, idx] for idx, feature in enumerate(COUNT_FEATURES)}
+    N1, N2 = columns['total_Op'], columns['total_Opnd']
+    n1, n2 = columns['uniq_Op'], columns['uniq_Opnd']
+
+    N = N1 + N2
+    # log2(1) = 0, поэтому функции без операторов и операндов получают V = 0
+    V = N * np.log2(np.maximum(n1 + n2, 1.))
+    D = (n1 / 2) * np.divide(N2, n2, out=np.zeros_like(N), where=n2 != 0)
+    I = np.divide(V, D, out=np.zeros_like(N), where=D != 0)
+    E = V * D
+
+    columns.update({
+        'n': N,
+        'v': _round(V),
+        'd': _round(D),
+        'i': _round(I),
+        'e': _round(E),
+        'b': _round(V / 3000),
+        't': _round(E / 18),
+    })
+    return columns
+
+
+class MetricsBatch:
+    """
+    Накопление непосредственно подсчитываемых величин для множества функций,
+    производные метрики вычисляются сразу для всего пакета при построении матрицы признаков
+    """
+    def __init__(self):
+        self.__rows: list[tuple[int, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self.__rows)
+
+    def append(self, counts: tuple[int, ...]):
+        self.__rows.append(counts)
+
+    def add_function(self, metrics: MetricsCppCode, function_code: str):
+        metrics.set_function_code(function_code)
+        self.__rows.append(metrics.count_raw())
+
+    def counts(self) -> list[tuple[int, ...]]:
+        # Значения COUNT_FEATURES добавленных функций в порядке добавления
+        return list(self.__rows)
+
+    def clear(self):
+        self.__rows.clear()
+
+    def to_matrix(self, features: list[str], dtype: type = np.float32) -> np.ndarray:
+        if not self.__rows:
+            return np.empty((0, len(features)), dtype=dtype)
+
+        columns = derive_halsted(np.array(self.__rows, dtype=np.float64))
+        return np.column_stack([columns[feature] for feature in features]).astype(dtype, copy=False)
@@ -0,0 +1,77 @@
+import re
+from typing import NamedTuple
+
+
+# Ключевые слова, которые по Холстеду считаются операторами
+KEYWORD_OPERATORS = frozenset([
+    'if', 'else', 'for', 'while', 'new', 'delete', 'return', 'sizeof', 'typeid',
+    'switch', 'case', 'default', 'goto', 'try', 'catch', 'throw',
+    'const_cast', 'static_cast', 'dynamic_cast', 'reinterpret_cast',
+])
+
+# Ключевые слова объявлений, которые не являются ни операторами, ни операндами
+DECLARATION_KEYWORDS = frozenset([
+    'void', 'bool', 'char', 'wchar_t', 'char8_t', 'char16_t', 'char32_t', 'short', 'int', 'long',
+    'float', 'double', 'signed', 'unsigned', 'auto', 'const', 'constexpr', 'static', 'volatile',
+    'extern', 'register', 'mutable', 'inline', 'struct', 'class', 'enum', 'union', 'typename',
+    'template', 'virtual', 'explicit', 'friend', 'using', 'namespace', 'typedef',
+    'public', 'private', 'protected', 'do', 'break', 'continue',
+])
+
+TOKEN_PATTERN = re.compile(r'''
+    (?P<newline>\n)
+  | (?P<space>[ \t\r\f\v]+)
+  | (?P<comment>//[^\n]*|/\*[\s\S]*?(?:\*/|\Z))
+  | (?P<string>"(?:\\[\s\S]|[^"\\\n])*"?)
+  | (?P<char>'(?:\\[\s\S]|[^'\\\n])*'?)
+  | (?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)
+  | (?P<word>[^\W\d]\w*)
+  | (?P<operator>>>=|<<=|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^]=|::|[-+*/%<>=!&|^~?,.(\[])
+  | (?P<punctuation>[;{}):\]])
+  | (?P<other>.)
+''', re.VERBOSE)
+
+
+class Token(NamedTuple):
+    """
+    kind — тип лексемы: comment, keyword, declaration, identifier, number,
+    string, char, operator, punctuation, other;
+    line — номер строки (с нуля), на которой лексема начинается
+    """
+    kind: str
+    value: str
+    line: int
+
+
+def tokenize(code: str, first_line: int = 0) -> tuple[list[Token], int]:
+    """
+    Разбиение исходного кода на лексемы за один проход.
+    Возвращает список лексем (без пробельных символов) и количество физических строк;
+    first_line — номер первой строки, если код является продолжением ранее разобранного текста
+    """
+    tokens: list[Token] = []
+    append = tokens.append
+    line = first_line
+
+    for match in TOKEN_PATTERN.finditer(code):
+        kind = match.lastgroup
+        if kind == 'newline':
+            line += 1
+            continue
+        if kind == 'space':
+            continue
+
+        value = match.group()
+        if kind == 'word':
+            if value in KEYWORD_OPERATORS:
+                kind = 'keyword'
+            elif value in DECLARATION_KEYWORDS:
+                kind = 'declaration'
+            else:
+                kind = 'identifier'
+
+        append(Token(kind, value, line))
+        if kind == 'comment' or kind == 'string' or kind == 'char':
+            line += value.count('\n')
+
+    return tokens, line + 1
@@ -0,0 +1,49 @@
+import re
+from bisect import bisect_left
+
+
+def find_line_breaks(code: str) -> list[int]:
+    """
+    Позиции переводов строк, не находящихся внутри строковых литералов.
+    Перевод строки считается разделителем, если после него стоит чётное количество кавычек
+    """
+    quotes_cnt = code.count('"')
+    if not quotes_cnt:
+        return [match.start() for match in re.finditer('\n', code)]
+
+    line_breaks: list[int] = []
+    for match in re.finditer(r'["\n]', code):
+        if match.group() == '"':
+            quotes_cnt -= 1
+        elif quotes_cnt % 2 == 0:
+            line_breaks.append(match.start())
+
+    return line_breaks
+
+
+def split_code_by_lines(code: str) -> list[str]:
+    lines: list[str] = []
+    start = 0
+
+    for line_break in find_line_breaks(code):
+        lines.append(code[start:line_break])
+        start = line_break + 1
+    lines.append(code[start:])
+
+    return lines
+
+
+class LineIndex:
+    """
+    Соответствие смещений в тексте номерам физических строк (с нуля), как у блоков QTextDocument
+    и в выводе git diff: номер строки находится двоичным поиском по позициям всех переводов строк,
+    в том числе внутри литералов и комментариев
+    """
+    def __init__(self, code: str):
+        self.__line_breaks = [match.start() for match in re.finditer('\n', code)]
+
+    def line_of(self, offset: int) -> int:
+        return bisect_left(self.__line_breaks, offset)
+
+    def lines_count(self) -> int:
+        return len(self.__line_breaks) + 1
@@ -0,0 +1,175 @@
+import numpy as np
+from collections import Counter
+from typing import NamedTuple
+from src.processing.lexer import Token
+from src.processing.metircs import BRANCH_POINTS, EXIT_POINTS, MULTILINE_KINDS, OPERAND_KINDS, OPERATOR_NAMES
+from src.processing.profiling import timed
+
+# Размер окна строк, для которого вычисляются метрики при локализации дефектов внутри функции
+WINDOW_LINES = 15
+
+
+class LineCounts(NamedTuple):
+    """
+    Вклад одной строки функции в метрики: операторы и операнды тела функции, начинающиеся на строке,
+    точки ветвления и выхода, есть ли на строке начало кода, отметки кода и комментария,
+    количество строк комментариев (как в MetricsCppCode, многострочный комментарий отмечает все свои строки)
+    """
+    operators: Counter
+    operands: Counter
+    branches_cnt: int
+    exits_cnt: int
+    is_code: bool
+    mark_code: bool
+    mark_comment: bool
+    comment_lines_cnt: int
+
+
+def split_line_counts(tokens: list[Token], lines_cnt: int) -> list[LineCounts]:
+    """
+    Вклады строк функции в метрики за один проход по лексемам (результат lexer.tokenize текста функции).
+    Заголовок функции (всё до первой фигурной скобки) в метриках Холстеда не учитывается
+    """
+    operators = [Counter() for _ in range(lines_cnt)]
+    operands = [Counter() for _ in range(lines_cnt)]
+    branches_cnt = [0] * lines_cnt
+    exits_cnt = [0] * lines_cnt
+    is_code = [False] * lines_cnt
+    mark_code = [False] * lines_cnt
+    mark_comment = [False] * lines_cnt
+    comment_lines_cnt = [0] * lines_cnt
+
+    in_body = False
+    # Идентификатор становится операндом, если за ним не следует ( или другой идентификатор
+    pending_operand: tuple[str, int] | None = None
+
+    for kind, value, line in tokens:
+        if kind in MULTILINE_KINDS:
+            is_comment = kind == 'comment'
+            for marked_line in range(line, line + value.count('\n') + 1):
+                if is_comment:
+                    mark_comment[marked_line] = True
+                    comment_lines_cnt[marked_line] += 1
+                else:
+                    mark_code[marked_line] = True
+            if is_comment:
+                continue
+        else:
+            mark_code[line] = True
+
+        is_code[line] = True
+        if value in BRANCH_POINTS:
+            branches_cnt[line] += 1
+        elif value in EXIT_POINTS:
+            exits_cnt[line] += 1
+
+        if pending_operand is not None:
+            if value != '(' and kind != 'identifier' and in_body:
+                operands[pending_operand[1]][pending_operand[0]] += 1
+            pending_operand = None
+
+        if kind == 'operator' or kind == 'keyword':
+            if in_body:
+                operators[line][OPERATOR_NAMES.get(value, value)] += 1
+        elif kind == 'identifier':
+            pending_operand = (value, line)
+        elif kind in OPERAND_KINDS:
+            if in_body:
+                operands[line][value] += 1
+        elif value == '{':
+            in_body = True
+
+    if pending_operand is not None and in_body:
+        operands[pending_operand[1]][pending_operand[0]] += 1
+
+    return [LineCounts(*values) for values in zip(operators, operands, branches_cnt, exits_cnt,
+                                                  is_code, mark_code, mark_comment, comment_lines_cnt)]
+
+
+class WindowCounter:
+    """
+    Метрики окна строк, которые обновляются при сдвиге окна: счётчики входящей строки добавляются,
+    покидающей — вычитаются, поэтому стоимость сдвига зависит только от размера этих строк.
+    Значения count_raw соответствуют COUNT_FEATURES, поправка v(g) для void-функций не применяется,
+    так как окно обычно не содержит конца функции
+    """
+    def __init__(self):
+        self.__operators: dict[str, int] = {}
+        self.__operands: dict[str, int] = {}
+        self.__total_operators = 0
+        self.__total_operands = 0
+        self.__lines_cnt = 0
+        self.__code_lines_cnt = 0
+        self.__branches_cnt = 0
+        self.__exits_cnt = 0
+        self.__marked_lines_cnt = 0
+        self.__mixed_lines_cnt = 0
+        self.__comment_lines_cnt = 0
+
+    @staticmethod
+    def __update(counter: dict[str, int], changes: Counter, sign: int) -> int:
+        for name, cnt in changes.items():
+            value = counter.get(name, 0) + sign * cnt
+            if value:
+                counter[name] = value
+            else:
+                del counter[name]
+        return sign * sum(changes.values())
+
+    def __shift(self, line: LineCounts, sign: int):
+        self.__total_operators += self.__update(self.__operators, line.operators, sign)
+        self.__total_operands += self.__update(self.__operands, line.operands, sign)
+        self.__lines_cnt += sign
+        self.__code_lines_cnt += sign * line.is_code
+        self.__branches_cnt += sign * line.branches_cnt
+        self.__exits_cnt += sign * line.exits_cnt
+        self.__marked_lines_cnt += sign * (line.mark_code or line.mark_comment)
+        self.__mixed_lines_cnt += sign * (line.mark_code and line.mark_comment)
+        self.__comment_lines_cnt += sign * line.comment_lines_cnt
+
+    def add(self, line: LineCounts):
+        self.__shift(line, 1)
+
+    def remove(self, line: LineCounts):
+        self.__shift(line, -1)
+
+    def count_raw(self) -> tuple[int, ...]:
+        complexity = 2 + self.__branches_cnt - self.__exits_cnt
+        return (self.__code_lines_cnt, complexity if complexity > 0 else 1,
+                self.__total_operators, self.__total_operands, len(self.__operators), len(self.__operands),
+                self.__lines_cnt, self.__comment_lines_cnt, self.__lines_cnt - self.__marked_lines_cnt,
+                self.__mixed_lines_cnt)
+
+
+@timed('localization.window_counts')
+def window_counts(lines: list[LineCounts], window_lines: int = WINDOW_LINES) -> list[tuple[int, int, tuple[int, ...]]]:
+    """
+    Окна [start_line, end_line) из window_lines строк функции (split_line_counts) с шагом в одну строку
+    (номера строк от начала функции) и значения COUNT_FEATURES каждого окна. Для функции не длиннее окна — одно окно
+    """
+    window_lines = min(window_lines, len(lines))
+    counter = WindowCounter()
+    for line in lines[:window_lines]:
+        counter.add(line)
+
+    windows = [(0, window_lines, counter.count_raw())]
+    for start in range(1, len(lines) - window_lines + 1):
+        counter.remove(lines[start - 1])
+        counter.add(lines[start + window_lines - 1])
+        windows.append((start, start + window_lines, counter.count_raw()))
+
+    return windows
+
+
+def line_risks(windows: list[tuple[int, int, tuple[int, ...]]], windows_proba: np.ndarray) -> np.ndarray:
+    """Вероятность дефектов каждой строки — среднее вероятностей содержащих её окон"""
+    lines_cnt = max((end for _, end, _ in windows), default=0)
+    proba_sums = np.zeros(lines_cnt + 1)
+    windows_cnt = np.zeros(lines_cnt + 1)
+    for (start, end, _), defects_proba in zip(windows, windows_proba):
+        proba_sums[start] += defects_proba
+        proba_sums[end] -= defects_proba
+        windows_cnt[start] += 1
+        windows_cnt[end] -= 1
+
+    return np.cumsum(proba_sums)[:-1] / np.maximum(np.cumsum(windows_cnt)[:-1], 1)
@@ -1,28 +1,268 @@
 import math
+from collections import Counter, deque
 import re
+from typing import Iterable
+from src.processing.lexer import Token, tokenize
+from src.processing.lines import split_code_by_lines
+from src.processing.profiling import timed
+
+
+BRANCH_POINTS = frozenset(['if', 'for', 'while', 'case', '||', '&&', 'catch', 'goto'])
+EXIT_POINTS = frozenset(['return', 'exit', 'throw'])
+OPERAND_KINDS = frozenset(['identifier', 'number', 'string', 'char'])
+MULTILINE_KINDS = frozenset(['comment', 'string', 'char'])
+# Продолжение литерала, перенесённого на следующую строку через \\ (как в lexer.TOKEN_PATTERN)
+LITERAL_TAILS = {
+    'string': re.compile(r'(?:\\[\s\S]|[^"\\\n])*"?'),
+    'char': re.compile(r"(?:\\[\s\S]|[^'\\\n])*'?"),
+}
+# Операторы, которые по Холстеду записываются вместе с парной частью
+OPERATOR_NAMES = {'(': '()', '[': '[]', '?': '? :'}
+
+# Версия вычисления метрик, увеличивается при любом изменении результатов (см. cache.FunctionCache)
+METRICS_VERSION = 1
+
+# Непосредственно подсчитываемые величины (порядок значений count_raw), остальные метрики выводятся из них
+COUNT_FEATURES = ['loc', 'v(g)', 'total_Op', 'total_Opnd', 'uniq_Op', 'uniq_Opnd',
+                  'lOCode', 'lOComment', 'lOBlank', 'lOCodeAndComment']
 
 
 class MetricsCppCode:
+    """
+    Метрики вычисляются за один проход по лексемам с накоплением счётчиков, текст и лексемы целиком не хранятся.
+    Код можно передавать частями: reset, feed для каждой части (например, для каждой строки файла) и finish,
+    объём памяти при этом зависит от количества различных операторов и операндов, а не от размера кода
+    """
     def __init__(self, function_code: str = ''):
-        self.__src = function_code
-        self.__code_lines = self.__delete_blank_and_comments()
+        self.set_function_code(function_code)
 
+    @timed('metrics.set_function_code')
     def set_function_code(self, function_code: str):
-        self.__src = function_code
-        self.__code_lines = self.__delete_blank_and_comments()
+        self.reset()
+        self.__buffer = function_code
+        self.finish()
+
+    def set_function_tokens(self, tokens: list[Token], lines_cnt: int):
+        # Уже разобранный код (lexer.tokenize), например, если лексемы нужны и для других вычислений
+        self.reset()
+        self.__finish_tokens(tokens, lines_cnt)
+
+    def set_function_stream(self, chunks: Iterable[str]):
+        # Например, открытый файл: код читается и разбирается построчно
+        self.reset()
+        for chunk in chunks:
+            self.feed(chunk)
+        self.finish()
+
+    def reset(self):
+        self.__buffer = ''
+        self.__first_line = 0
+        self.__lines_cnt = 1
+
+        # Незакрытая многострочная лексема между частями кода: тип, строка начала, число переводов строк.
+        # Текст комментария не хранится, в новых частях ищется только */ (или конец литерала)
+        self.__open_kind: str | None = None
+        self.__open_line = 0
+        self.__open_newlines = 0
+        self.__open_parts: list[str] = []
+
+        # Строки, на которых начинаются лексемы кода (не комментарии)
+        self.__code_line = -1
+        self.__code_lines_cnt = 0
+        self.__is_void = False
+        # Для трёх последних строк кода: есть ли return; есть ли ветвление, else или default
+        self.__last_code_lines: deque[tuple[bool, bool]] = deque(maxlen=3)
+        self.__has_return = False
+        self.__has_branch = False
+
+        self.__branches_cnt = 0
+        self.__exits_cnt = 0
+
+        self.__in_body = False
+        self.__operators: Counter[str] = Counter()
+        self.__operands: Counter[str] = Counter()
+        # Идентификатор становится операндом, если за ним не следует ( или другой идентификатор
+        self.__pending_operand: str | None = None
+
+        # Отметки текущей строки для подсчёта строк с кодом и комментариями
+        self.__mark_line = -1
+        self.__mark_code = False
+        self.__mark_comment = False
+        self.__marked_lines_cnt = 0
+        self.__mixed_lines_cnt = 0
+        self.__comment_lines_cnt = 0
+
+    def feed(self, chunk: str):
+        """
+        Очередная часть кода. Разбираются только завершённые строки,
+        незакрытый многострочный комментарий или литерал ожидает следующих частей
+        """
+        self.__buffer += chunk
+        cut = self.__buffer.rfind('\n') + 1
+        if not cut:
+            return
+        if self.__open_kind is not None:
+            start = self.__continue_open(cut)
+            if start is None:
+                return
+            cut -= start
+            if not cut:
+                return
+
+        tokens, _ = tokenize(self.__buffer[:cut], self.__first_line)
+        # Лексема продолжается в следующих частях, только если доходит до конца разобранного текста
+        if tokens and self.__is_unterminated(tokens[-1]) and self.__buffer.endswith(tokens[-1].value, 0, cut):
+            self.__open(tokens.pop())
+
+        self.__first_line += self.__buffer.count('\n', 0, cut)
+        self.__buffer = self.__buffer[cut:]
+        self.__consume(tokens)
+
+    def finish(self):
+        if self.__open_kind is not None:
+            self.__continue_open(len(self.__buffer), True)
+        tokens, lines_cnt = tokenize(self.__buffer, self.__first_line)
+        self.__buffer = ''
+        self.__finish_tokens(tokens, lines_cnt)
+
+    def __open(self, token: Token):
+        self.__open_kind = token.kind
+        self.__open_line = token.line
+        self.__open_newlines = token.value.count('\n')
+        if token.kind != 'comment':
+            self.__open_parts = [token.value]
+
+    def __continue_open(self, cut: int, is_last: bool = False) -> int | None:
+        """
+        Продолжение незакрытой лексемы в buffer[:cut]. Если лексема закрылась, она разбирается,
+        а из буфера удаляется её конец; возвращается число удалённых символов. Иначе буфер до cut
+        поглощается лексемой и возвращается None (при is_last лексема закрывается концом кода)
+        """
+        buffer = self.__buffer
+        if self.__open_kind == 'comment':
+            # Части разрезаются после перевода строки, поэтому */ целиком лежит в новой части
+            end = buffer.find('*/', 0, cut)
+            end = -1 if end < 0 else end + 2
+        else:
+            match = LITERAL_TAILS[self.__open_kind].match(buffer, 0, cut)
+            end = match.end()
+            if end == cut and buffer.endswith('\n', 0, cut):
+                end = -1
+            self.__open_parts.append(buffer[:cut if end < 0 else end])
+
+        if end < 0 and not is_last:
+            self.__open_newlines += buffer.count('\n', 0, cut)
+            self.__first_line += buffer.count('\n', 0, cut)
+            self.__buffer = buffer[cut:]
+            return None
+
+        end = cut if end < 0 else end
+        newlines = self.__open_newlines + buffer.count('\n', 0, end)
+        if self.__open_kind == 'comment':
+            value = '/*' + '\n' * newlines + '*/'
+        else:
+            value = ''.join(self.__open_parts)
+        token = Token(self.__open_kind, value, self.__open_line)
+        self.__open_kind = None
+        self.__open_parts = []
+        self.__first_line = self.__open_line + newlines
+        self.__buffer = buffer[end:]
+        self.__consume([token])
+        return end
+
+    def __finish_tokens(self, tokens: list[Token], lines_cnt: int):
+        self.__lines_cnt = lines_cnt
+        self.__consume(tokens)
+
+        if self.__pending_operand is not None:
+            self.__operands[self.__pending_operand] += 1
+            self.__pending_operand = None
+        if self.__code_line >= 0:
+            self.__last_code_lines.append((self.__has_return, self.__has_branch))
+            self.__code_line = -1
+        self.__flush_mark()
 
     @staticmethod
-    def split_code_by_lines(code: str) -> list[str]:
-        return re.split(r'\n(?=[^"]*(?:"[^"]*"[^"]*)*$)', code)
+    def __is_unterminated(token: Token) -> bool:
+        # Лексема продолжается за концом переданной части
+        if token.kind == 'comment':
+            return token.value.startswith('/*') and (len(token.value) < 4 or not token.value.endswith('*/'))
+        return (token.kind == 'string' or token.kind == 'char') and token.value.endswith('\n')
+
+    def __flush_mark(self):
+        if self.__mark_code or self.__mark_comment:
+            self.__marked_lines_cnt += 1
+            if self.__mark_code and self.__mark_comment:
+                self.__mixed_lines_cnt += 1
+        self.__mark_code = self.__mark_comment = False
+
+    def __consume(self, tokens: list[Token]):
+        operators = self.__operators
+        operands = self.__operands
+
+        for kind, value, line in tokens:
+            # Строки с кодом и комментариями: многострочная лексема отмечает все свои строки
+            if line != self.__mark_line:
+                self.__flush_mark()
+                self.__mark_line = line
+            is_comment = kind == 'comment'
+            if is_comment:
+                self.__mark_comment = True
+            else:
+                self.__mark_code = True
+            if kind in MULTILINE_KINDS:
+                last_line = line + value.count('\n')
+                if is_comment:
+                    self.__comment_lines_cnt += last_line - line + 1
+                if last_line != line:
+                    self.__flush_mark()
+                    self.__marked_lines_cnt += last_line - line - 1
+                    self.__mark_line = last_line
+                    self.__mark_comment = is_comment
+                    self.__mark_code = not is_comment
+            if is_comment:
+                continue
 
-    @staticmethod
-    def __get_re_for_comments() -> str:
-        return r'(//.*)|(/\*[\s\S]*?\*/)'
+            if line != self.__code_line:
+                if self.__code_line >= 0:
+                    self.__last_code_lines.append((self.__has_return, self.__has_branch))
+                self.__code_line = line
+                self.__code_lines_cnt += 1
+                self.__has_return = self.__has_branch = False
+
+            if value in BRANCH_POINTS:
+                self.__branches_cnt += 1
+                self.__has_branch = True
+            elif value in EXIT_POINTS:
+                self.__exits_cnt += 1
+                if value == 'return':
+                    self.__has_return = True
+            elif value == 'else' or value == 'default':
+                self.__has_branch = True
+            elif value == 'void' and self.__code_lines_cnt == 1:
+                self.__is_void = True
+
+            if self.__pending_operand is not None:
+                # Имена вызываемых функций и типов в объявлениях операндами не считаются
+                if value != '(' and kind != 'identifier':
+                    operands[self.__pending_operand] += 1
+                self.__pending_operand = None
+
+            if kind == 'operator' or kind == 'keyword':
+                operators[OPERATOR_NAMES.get(value, value)] += 1
+            elif kind == 'identifier':
+                self.__pending_operand = value
+            elif kind in OPERAND_KINDS:
+                operands[value] += 1
+            elif value == '{' and not self.__in_body:
+                # Заголовок функции (всё до первой фигурной скобки) в метриках Холстеда не учитывается
+                self.__in_body = True
+                operators.clear()
+                operands.clear()
 
-    def __delete_blank_and_comments(self):
-        clean_code = re.sub(self.__get_re_for_comments(), '', self.__src)
-        code_lines = self.split_code_by_lines(clean_code)
-        return [line.strip() for line in code_lines if line.strip()]
+    @staticmethod
+    def split_code_by_lines(code: str) -> list[str]:
+        return split_code_by_lines(code)
 
     def count(self) -> dict[str, int | float]:
         return {
@@ -32,124 +272,51 @@ class MetricsCppCode:
             **self.count_halsted_loc_metrics()
         }
 
+    def count_raw(self) -> tuple[int, ...]:
+        """
+        Значения COUNT_FEATURES без вычисления производных метрик Холстеда и построения словаря,
+        для пакетной обработки (см. halstead.MetricsBatch)
+        """
+        N1, N2, n1, n2 = self.count_operators_operands()
+        line_metrics = self.count_halsted_loc_metrics()
+        return (self.count_loc(), self.count_vg(), N1, N2, n1, n2, line_metrics['lOCode'],
+                line_metrics['lOComment'], line_metrics['lOBlank'], line_metrics['lOCodeAndComment'])
+
+    @timed('metrics.count_loc')
     def count_loc(self) -> int:
-        return len(self.__code_lines)
+        return self.__code_lines_cnt
 
+    @timed('metrics.count_vg')
     def count_vg(self) -> int:
         """
         v(g) = π − s + 2,
         π — число точек ветвления в программе,
         s — число точек выхода
         """
-        def count_occurrences(code_lines: list[str], word: str) -> int:
-            return sum([line.count(word) for line in code_lines])
-
-        complexity = 2
-
-        branch_points = ['if', 'for', 'while', 'case', '||', '&&', 'catch', 'goto']
-        for point in branch_points:
-            complexity += count_occurrences(self.__code_lines, point)
-
-        exit_points = ['return', 'exit', 'throw']
-        for point in exit_points:
-            complexity -= count_occurrences(self.__code_lines, point)
+        complexity = 2 + self.__branches_cnt - self.__exits_cnt
 
         # Если void, то в конце можно не делать return, однако complexity должна измениться
-        if 'void' in self.__code_lines[0]:
-            last_lines = self.__code_lines[-2] + self.__code_lines[-1]
-            if 'return' not in last_lines:
+        if self.__is_void:
+            last_code_lines = list(self.__last_code_lines)
+            if not any(has_return for has_return, _ in last_code_lines[-2:]):
+                complexity -= 1
+            elif len(last_code_lines) == 3 and last_code_lines[0][1]:
                 complexity -= 1
-            else:
-                for point in branch_points + ['else', 'default']:
-                    if point in self.__code_lines[-3]:
-                        complexity -= 1
-                        break
 
         return complexity if complexity > 0 else 1
 
-    def count_n_metrics(self) -> dict[str, int | float]:
-        # Вынесены отдельно, потому что возникают трудности,
-        # связанные с типами при объявлении переменных
-        equal_operator = r'(?<!=|!|>|<|\+|-|\*|\/|%|&|\||\^)=(?!=)'
-        asterisk_operator = r'\*(?!=)'
-
-        # Регулярные выражения написаны для того,
-        # чтобы различать операторы, входящие в состав других (н-р, > и >=)
-        regex_operators = [
-            equal_operator,
-            r'(?<!\+)\+(?!\+|=)', r'(?<!-)-(?!-|=)',
-            r'\/(?!=)', r'%(?!=)',
-            r'(?<!>)>(?!=|>)', r'(?<!<)<(?!=|<)',
-            r'==', r'!=', r'(?<!>)>=', r'(?<!<)<=',
-            r'(?<!&)&(?!&|=)', r'(?<!\|)\|(?!\||=)', r'\^(?!=)',
-            r'<<(?!=)', r'>>(?!=)',
-            r'\+=', r'-=', r'\*=', r'\/=', r'%=',
-            r'&=', r'\|=', r'\^=', r'<<=', r'>>=',
-            r'\[', r'\.(?=[^0-9])', r'->', r',', r'\(',
-            r'!(?!=)', r'~',
-            r'\+\+', r'--',
-            r'&&', r'\|\|',
-            r'\bif\b', r'\belse\b', r'\?',
-            r'\bfor\b', r'\bwhile\b',
-            r'::', r'\bnew\b', r'\bdelete\b', r'\breturn\b',
-            r'\bsizeof\b', r'\btypeid\b',
-            r'\bswitch\b', r'\bcase\b', r'\bdefault\b',
-            r'\bgoto\b', r'\btry\b', r'\bcatch\b', r'\bthrow\b',
-            r'\bconst_cast\b', r'\bstatic_cast\b',
-            r'\bdynamic_cast\b', r'\breinterpret_cast\b',
-        ]
-
-        pattern_operators = '|'.join(regex_operators)
-        operators: list[str] = []
-        operands: list[str] = []
-
-        for line in self.__code_lines[1:]:
-            operators_from_line = re.findall(pattern_operators + rf'|{asterisk_operator}', line)
-            if not operators_from_line:
-                continue
+    @timed('metrics.count_operators_operands')
+    def count_operators_operands(self) -> tuple[int, int, int, int]:
+        """
+        N1, N2 — общее число операторов и операндов,
+        n1, n2 — число уникальных операторов и операндов
+        """
+        return (sum(self.__operators.values()), sum(self.__operands.values()),
+                len(self.__operators), len(self.__operands))
 
-            operators.extend(operators_from_line)
-            line = re.sub(r'(\s+|^)\w+\s*\(|\)|const\s+|{|}|]', r' ', line)
-
-            eq_operands = re.split(equal_operator, line, maxsplit=1)
-            if len(eq_operands) > 1 and eq_operands[0]:
-                left_eq_operands = [operand.strip() for operand in re.split(pattern_operators, eq_operands[0])
-                                    if operand.strip()]
-                left_operand = re.split(rf' |{asterisk_operator}', left_eq_operands[0])
-                left_operand = [operand.strip() for operand in left_operand if operand.strip()]
-
-                if len(left_operand) > 1:
-                    operands.extend(left_operand[1:])
-                else:
-                    operands.append(left_operand[0])
-
-                for operand in left_eq_operands[1:]:
-                    operands.extend(operand.split(' '))
-                line = '=' + eq_operands[1]
-
-            if len(re.split(equal_operator, line)) == 1:
-                aster_operands = re.split(asterisk_operator, line)
-                aster_operands = [operand.strip() for operand in aster_operands]
-                if len(aster_operands) > 1:
-                    line = ','.join(aster_operands[1:])
-
-            tokens = re.split(pattern_operators + rf'|;|{asterisk_operator}|:', line)
-            tokens = [token.strip() for token in tokens if token.strip()]
-            if tokens:
-                first_token = tokens[0].split(' ', maxsplit=1)
-                if len(first_token) > 1:
-                    tokens[0] = first_token[1].strip()
-
-            for token in tokens:
-                operands.extend(token.split(' '))
-
-        operators = [operator.replace('(', '()').replace('[', '[]').replace('?', '? :')
-                     for operator in operators]
-
-        N1 = len(operators)
-        N2 = len(operands)
-        n1 = len(set(operators))
-        n2 = len(set(operands))
+    @timed('metrics.count_n_metrics')
+    def count_n_metrics(self) -> dict[str, int | float]:
+        N1, N2, n1, n2 = self.count_operators_operands()
 
         # Необходимые значения метрик
         N = N1 + N2
@@ -174,19 +341,11 @@ class MetricsCppCode:
             'total_Opnd': N2,
         }
 
+    @timed('metrics.count_halsted_loc_metrics')
     def count_halsted_loc_metrics(self) -> dict[str, int]:
-        code_lines = self.split_code_by_lines(self.__src)
-        blank_lines = [line for line in code_lines if not line.strip()]
-
-        comment_lines = re.findall(self.__get_re_for_comments(), self.__src)
-        comment_lines = [next(filter(None, line)) for line in comment_lines]
-        comment_lines = [len(self.split_code_by_lines(line)) for line in comment_lines]
-
-        mixed_lines = re.findall(r';\s*//', self.__src)
-
         return {
-            'lOCode': len(code_lines),
-            'lOComment': sum(comment_lines),
-            'lOBlank': len(blank_lines),
-            'lOCodeAndComment': len(mixed_lines),
+            'lOCode': self.__lines_cnt,
+            'lOComment': self.__comment_lines_cnt,
+            'lOBlank': self.__lines_cnt - self.__marked_lines_cnt,
+            'lOCodeAndComment': self.__mixed_lines_cnt,
         }
@@ -0,0 +1,183 @@
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable
+
+# Верхние границы интервалов гистограмм времени, секунды (от 1 мкс до ~2 мин)
+BUCKETS = tuple(1e-6 * 2 ** power for power in range(28))
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.buckets[bisect_left(BUCKETS, value)] += 1
+
+    def merge(self, other: 'Histogram'):
+        self.count += other.count
+        self.total += other.total
+        self.buckets = [count + other_count for count, other_count in zip(self.buckets, other.buckets)]
+
+    def percentile(self, q: float) -> float:
+        # Оценка сверху: граница интервала, в который попадает перцентиль
+        rank = q * self.count
+        cumulative = 0
+        for idx, count in enumerate(self.buckets):
+            cumulative += count
+            if count and cumulative >= rank:
+                return BUCKETS[idx] if idx < len(BUCKETS) else math.inf
+        return 0.
+
+    def to_dict(self) -> dict[str, float]:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+class _Timer:
+    __slots__ = ('__profiler', '__name', '__start_time')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.__profiler = profiler
+        self.__name = name
+        self.__start_time = 0.
+
+    def __enter__(self):
+        self.__start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.__profiler.observe(self.__name, time.perf_counter() - self.__start_time)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Profiler:
+    """
+    Счётчики и гистограммы времени этапов анализа. По умолчанию выключен (или включается
+    переменной окружения GBDD_PROFILE=1), в выключенном состоянии timer возвращает пустой контекстный менеджер
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.__histograms: dict[str, Histogram] = {}
+        self.__counters: dict[str, int] = {}
+        self.__lock = threading.Lock()
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def timer(self, name: str) -> _Timer | _NullTimer:
+        return _Timer(self, name) if self.enabled else NULL_TIMER
+
+    def observe(self, name: str, seconds: float):
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = self.__histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, value: int = 1):
+        if self.enabled:
+            with self.__lock:
+                self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def reset(self):
+        with self.__lock:
+            self.__histograms = {}
+            self.__counters = {}
+
+    def snapshot(self) -> dict:
+        """Состояние для передачи из процесса пула и объединения методом merge"""
+        with self.__lock:
+            return {
+                'histograms': {name: (histogram.count, histogram.total, list(histogram.buckets))
+                               for name, histogram in self.__histograms.items()},
+                'counters': dict(self.__counters),
+            }
+
+    def merge(self, snapshot: dict):
+        with self.__lock:
+            for name, (count, total, buckets) in snapshot['histograms'].items():
+                other = Histogram()
+                other.count, other.total, other.buckets = count, total, buckets
+                self.__histograms.setdefault(name, Histogram()).merge(other)
+            for name, value in snapshot['counters'].items():
+                self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        with self.__lock:
+            return {
+                'timers': {name: histogram.to_dict() for name, histogram in sorted(self.__histograms.items())},
+                'counters': dict(sorted(self.__counters.items())),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self, prefix: str = 'gbdd') -> str:
+        def metric_name(name: str) -> str:
+            return prefix + '_' + ''.join(char if char.isalnum() else '_' for char in name)
+
+        lines: list[str] = []
+        with self.__lock:
+            for name, histogram in sorted(self.__histograms.items()):
+                metric = metric_name(name) + '_seconds'
+                lines.append(f'# TYPE {metric} histogram')
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum {histogram.total}')
+                lines.append(f'{metric}_count {histogram.count}')
+
+            for name, value in sorted(self.__counters.items()):
+                metric = metric_name(name) + '_total'
+                lines.append(f'# TYPE {metric} counter')
+                lines.append(f'{metric} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str):
+        # Формат определяется расширением файла: .prom — Prometheus, иначе JSON
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(self.to_prometheus() if path.endswith('.prom') else self.to_json())
+
+
+PROFILER = Profiler(enabled=os.environ.get('GBDD_PROFILE', '') not in ('', '0'))
+
+
+def timed(name: str) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with _Timer(PROFILER, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
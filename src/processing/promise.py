@@ -1,12 +1,18 @@
+import hashlib
+import json
 import matplotlib.pyplot as plt
 import numpy as np
 import os
 import pandas as pd
 import requests
+import warnings
 from scipy.io import arff
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
-from src.processing.config import PROMISE_URL, SEED
+from src.processing.config import MAX_LOC, PROMISE_URL, SEED
+
+# Версия формата кэша подготовленного набора данных, увеличивается при изменении очистки
+CACHE_VERSION = 2
 
 
 def download_dataset(name: str, dataset_path: str) -> str:
@@ -23,11 +29,104 @@ def download_dataset(name: str, dataset_path: str) -> str:
     return path
 
 
+def get_file_hash(path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
 class PromiseDataset:
     def __init__(self, dataset_path: str):
         self.file: str = download_dataset('jm1', dataset_path)
+        self.cache_file: str = os.path.splitext(self.file)[0] + '.npz'
+        self.scaler: StandardScaler | None = None
+
+    def __read_arff(self, max_loc: int | None) -> tuple[pd.DataFrame, pd.Series]:
+        dataset = arff.loadarff(self.file)
+        df = pd.DataFrame(dataset[0]).dropna().drop_duplicates().reset_index(drop=True)
+        if max_loc is not None:
+            df = df[df['loc'] <= max_loc]
+        df = df[df['n'] != 0]
+
+        target_name = 'defects'
+        target: pd.Series = df[target_name].map({
+            b'true': True,
+            b'false': False
+        })
 
-    def prepare(self, graphics=False) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        unnecessary_columns = ['ev(g)', 'iv(g)', 'l', 'branchCount', target_name]
+        data_types = {metric: np.float32 for metric in ['v', 'd', 'i', 'e', 'b', 't']}
+        data_types.update({metric: np.int32 for metric in ['loc', 'v(g)', 'n', 'lOCode', 'lOComment',
+                                                           'lOBlank', 'locCodeAndComment', 'uniq_Op',
+                                                           'uniq_Opnd', 'total_Op', 'total_Opnd']})
+        features: pd.DataFrame = df.drop(unnecessary_columns, axis=1).astype(data_types)
+        # Столбец называется так же, как метрика, вычисляемая MetricsCppCode
+        features = features.rename(columns={'locCodeAndComment': 'lOCodeAndComment'})
+
+        return features, target
+
+    def __read_cache(self, cache_key: str) -> tuple[pd.DataFrame, pd.Series] | None:
+        # None, если кэша нет, он создан для других параметров или записан в несовместимом виде
+        if not os.path.isfile(self.cache_file):
+            return None
+
+        try:
+            with np.load(self.cache_file, allow_pickle=False) as cache:
+                if str(cache['key']) != cache_key:
+                    return None
+                columns = [str(column) for column in cache['columns']]
+                features = pd.DataFrame({column: cache[f'column_{idx}'] for idx, column in enumerate(columns)})
+                return features, pd.Series(cache['target'], name='defects')
+        except (ValueError, KeyError, OSError):
+            return None
+
+    def load(self, max_loc: int | None = MAX_LOC) -> tuple[pd.DataFrame, pd.Series]:
+        """
+        Очищенные признаки и целевая переменная. Результат очистки хранится в npz-файле рядом
+        с набором данных и используется повторно, пока не изменятся файл ARFF или параметры очистки
+        """
+        cache_key = json.dumps({
+            'version': CACHE_VERSION,
+            'file_hash': get_file_hash(self.file),
+            'max_loc': max_loc,
+        }, sort_keys=True)
+
+        cached = self.__read_cache(cache_key)
+        if cached is not None:
+            return cached
+
+        features, target = self.__read_arff(max_loc)
+        features = features.reset_index(drop=True)
+        target = target.reset_index(drop=True)
+
+        temp_file = f'{self.cache_file}.{os.getpid()}.tmp'
+        try:
+            with open(temp_file, 'wb') as f:
+                # Имена столбцов сохраняются строками фиксированной длины: массив объектов читается только через pickle
+                np.savez(f, key=np.array(cache_key), columns=np.array(features.columns, dtype=str),
+                         target=target.to_numpy(bool),
+                         **{f'column_{idx}': features[column].to_numpy()
+                            for idx, column in enumerate(features.columns)})
+            os.replace(temp_file, self.cache_file)
+        finally:
+            # Недописанный временный файл не остаётся рядом с набором данных
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+        # Записанный кэш должен читаться следующим запуском, иначе он удаляется, а данные возвращаются без кэша
+        if self.__read_cache(cache_key) is None:
+            warnings.warn(f'Dataset cache {self.cache_file} cannot be read back and is removed', RuntimeWarning)
+            try:
+                os.remove(self.cache_file)
+            except OSError:
+                pass
+
+        return features, target
+
+    def prepare(self, graphics=False, max_loc: int | None = MAX_LOC) -> tuple[pd.DataFrame, pd.DataFrame,
+                                                                              pd.DataFrame, pd.DataFrame]:
         """
         1. loc              : numeric % McCabe's line count of code
                               количество всех непустых строк исходного кода без комментариев (LLOC)
@@ -66,60 +165,28 @@ class PromiseDataset:
         18. defects         : {false,true} % module has/has not one or more reported defects
                               модуль имеет/не имеет одного или нескольких зарегистрированных дефектов
         """
-        dataset = arff.loadarff(self.file)
-        df = pd.DataFrame(dataset[0]).dropna().drop_duplicates().reset_index(drop=True)
-        df = df[df['loc'] <= 2000]
-        df = df[df['n'] != 0]
+        features, target = self.load(max_loc)
 
-        defects = df.groupby('defects')['b'].apply(lambda x: x.count())
-        print(f'false  = {defects[0]}, true = {defects[1]}')
+        defects = target.value_counts()
+        print(f'false  = {defects[False]}, true = {defects[True]}')
 
         if graphics:
-            df.boxplot(column='v(g)')
-            print(df['loc'].describe())
-            plt.show()
-
-            plt.plot(df['v(g)'], label='v(g)')
-            plt.plot(df['defects'].map({
-                b'true': 10,
-                b'false': 1
-            }), label='defects')
-            plt.legend()
-            plt.show()
-
-            plt.plot(df['loc'], label='loc')
-            plt.plot(df['defects'].map({
-                b'true': 10,
-                b'false': 1
-            }), label='defects')
-            plt.legend()
+            features.boxplot(column='v(g)')
+            print(features['loc'].describe())
             plt.show()
 
-            plt.plot(df['n'], label='n')
-            plt.plot(df['defects'].map({
-                b'true': 10,
-                b'false': 1
-            }), label='defects')
-            plt.legend()
-            plt.show()
-
-        target_name = 'defects'
-        target: pd.Series = df[target_name].map({
-            b'true': True,
-            b'false': False
-        })
-
-        unnecessary_columns = ['ev(g)', 'iv(g)', 'l', 'branchCount', target_name]
-        data_types = {metric: np.float32 for metric in ['v', 'd', 'i', 'e', 'b', 't']}
-        data_types.update({metric: np.int32 for metric in ['loc', 'v(g)', 'n', 'lOCode', 'lOComment',
-                                                           'lOBlank', 'locCodeAndComment', 'uniq_Op',
-                                                           'uniq_Opnd', 'total_Op', 'total_Opnd']})
-        features: pd.DataFrame = df.drop(unnecessary_columns, axis=1).astype(data_types)
-
+            for column in ['v(g)', 'loc', 'n']:
+                plt.plot(features[column], label=column)
+                plt.plot(target.map({
+                    True: 10,
+                    False: 1
+                }), label='defects')
+                plt.legend()
+                plt.show()
+
+        # Признаки возвращаются без стандартизации: её выполняет модель (GBDDModel.fit сохраняет scaler
+        # в файле модели), поэтому predict принимает исходные метрики, как и при анализе кода
         X_train, X_test, y_train, y_test = train_test_split(features, target, test_size=0.2, random_state=SEED)
-        scaler = StandardScaler()
-        scaler.fit(X_train)
-        X_train = scaler.transform(X_train)
-        X_test = scaler.transform(X_test)
+        self.scaler = StandardScaler().fit(X_train)
 
         return X_train, X_test, y_train, y_test
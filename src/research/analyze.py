@@ -1,15 +1,18 @@
 import matplotlib
 import matplotlib.pyplot as plt
 import pandas as pd
-from src.model.model import GBDDModel
+from src.model.inference import GBDDPredictor
 from src.processing.metircs import MetricsCppCode
 from src.research.utils import generate_code
-from time import time
+from time import perf_counter, time
 
 REPEAT_TIMES = 10
+# Количество вызовов модели при замере задержки предсказания одной функции
+PREDICT_REPEAT_TIMES = 1000
 
 
-def count_time(metrics: MetricsCppCode, model: GBDDModel, function: str) -> float:
+def count_time(metrics: MetricsCppCode, model: GBDDPredictor, function: str, fast: bool = False) -> float:
+    # fast — предсказание через GBDDPredictor.predict_proba_one вместо таблицы pandas
     get_time = time
     result_time = 0.
 
@@ -17,27 +20,53 @@ def count_time(metrics: MetricsCppCode, model: GBDDModel, function: str) -> floa
         start_time = get_time()
         metrics.set_function_code(function)
         metric_values = metrics.count()
-        _ = model.predict_proba(pd.DataFrame(metric_values, index=[0]))[0][1]
+        if fast:
+            _ = model.predict_proba_one(metric_values)
+        else:
+            _ = model.predict_proba(pd.DataFrame(metric_values, index=[0]))[0][1]
         result_time += get_time() - start_time
 
     return result_time / REPEAT_TIMES
 
 
+def count_predict_latency(model: GBDDPredictor, metric_values: dict[str, int | float]) -> tuple[float, float]:
+    """Среднее время одного предсказания через pandas и через predict_proba_one, секунды"""
+    latencies: list[float] = []
+    for predict in (lambda: model.predict_proba(pd.DataFrame(metric_values, index=[0]))[0][1],
+                    lambda: model.predict_proba_one(metric_values)):
+        predict()
+        start_time = perf_counter()
+        for _ in range(PREDICT_REPEAT_TIMES):
+            predict()
+        latencies.append((perf_counter() - start_time) / PREDICT_REPEAT_TIMES)
+
+    return latencies[0], latencies[1]
+
+
 def main():
     metrics = MetricsCppCode()
-    model = GBDDModel(model_file='../app/model.pkl')
+    model = GBDDPredictor(model_file='../app/model.ubj')
     times: list[float] = []
+    fast_times: list[float] = []
+
+    metrics.set_function_code(generate_code(100))
+    pandas_latency, fast_latency = count_predict_latency(model, metrics.count())
+    print(f'PREDICT LATENCY: pandas = {pandas_latency * 1e6:.1f} us, fast = {fast_latency * 1e6:.1f} us')
 
     for lines_cnt in range(0, 2000, 20):
         print(f'LINES = {lines_cnt}')
         function = generate_code(lines_cnt)
         times.append(count_time(metrics, model, function))
+        fast_times.append(count_time(metrics, model, function, fast=True))
 
     print(times)
+    print(fast_times)
     matplotlib.use('Qt5Agg')
-    plt.plot(list(range(0, 2000, 20)), times)
+    plt.plot(list(range(0, 2000, 20)), times, label='pandas')
+    plt.plot(list(range(0, 2000, 20)), fast_times, label='predict_proba_one')
     plt.xlabel('Количество строк')
     plt.ylabel('Время выполнения, сек')
+    plt.legend()
     plt.show()
 
 
@@ -0,0 +1,270 @@
+"""
+Воспроизводимый замер производительности отдельных этапов анализа:
+python -m src.research.benchmark [--output FILE] [--baseline FILE] [--tolerance 0.3] [--save-baseline FILE]
+    [--repeat N] [--confirm K] [--min-time US] [--min-increase US]
+
+Этапы (лексический анализ, вычисление метрик MetricsCppCode, поиск функций, построение DataFrame,
+предсказание модели) замеряются отдельно на функциях разного размера, результаты (перцентили времени)
+сохраняются в JSON. При сравнении с базовыми результатами код возврата равен 1, если время какого-либо этапа
+относительно калибровочной нагрузки выросло больше чем на tolerance и больше чем на --min-increase.
+Этапы, которые быстрее --min-time, не сравниваются: их время определяется в основном шумом измерений.
+Этапы на pandas и numpy (DataFrame, предсказание модели) делятся на время отдельной калибровочной нагрузки
+на pandas, остальные — на время нагрузки на чистом Python. Найденные регрессии перепроверяются: этапы
+замеряются ещё --confirm - 1 раз, и регрессией считается только рост, который повторился во всех запусках
+(сравнивается наименьшее время по запускам).
+
+Базовые результаты зависят от машины и не хранятся в репозитории. Их сохраняют на той же машине, где затем
+проверяются изменения, до внесения изменений:
+    python -m src.research.benchmark -o /dev/null --save-baseline baseline.json
+и после изменений сравнивают:
+    python -m src.research.benchmark -o results.json --baseline baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable
+import numpy as np
+import pandas as pd
+from src.model.inference import GBDDPredictor
+from src.processing.functions import extract_functions
+from src.processing.lexer import tokenize
+from src.processing.metircs import MetricsCppCode
+from src.research.utils import generate_code
+
+SEED = 123
+REPEAT_TIMES = 30
+# Количество запусков, в которых должна повториться регрессия
+CONFIRM_TIMES = 3
+# Наименьшая длительность одного замера: быстрые этапы выполняются в замере несколько раз, как в timeit
+MIN_SAMPLE_TIME = 0.002
+# Этапы быстрее MIN_STAGE_TIME и рост времени меньше MIN_INCREASE регрессиями не считаются, секунды
+MIN_STAGE_TIME = 50e-6
+MIN_INCREASE = 20e-6
+CALIBRATION_STAGE = 'calibration'
+LIBRARY_CALIBRATION_STAGE = 'calibration[pandas]'
+TIME_STATISTICS = ('relative', 'min', 'mean', 'p50', 'p90', 'p99')
+# Этапы, время которых определяется в основном pandas и numpy: их время меняется вместе с
+# калибровочной нагрузкой на pandas, а не на чистом Python (у построения DataFrame рост доходил до 35%)
+LIBRARY_STAGES = ('dataframe', 'predict_proba')
+LINES_COUNTS = [10, 100, 500, 1000, 2000]
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'examples')
+MODEL_FILE = os.path.join(os.path.dirname(__file__), '..', 'app', 'model.ubj')
+
+
+def calibration():
+    # Постоянная нагрузка на чистом Python: время этапов делится на её время, чтобы сравнение
+    # не зависело от частоты процессора и фоновой нагрузки машины во время запуска
+    total = 0
+    for idx in range(20000):
+        total += idx * idx % 7
+    return total
+
+
+def library_calibration():
+    # Постоянная нагрузка на pandas и numpy для этапов из LIBRARY_STAGES
+    data = pd.DataFrame({f'column{idx}': [float(idx)] for idx in range(17)}, index=[0])
+    return data.to_numpy(dtype=np.float32).sum()
+
+
+def get_calibration_stage(stage_name: str) -> str:
+    return LIBRARY_CALIBRATION_STAGE if stage_name.startswith(LIBRARY_STAGES) else CALIBRATION_STAGE
+
+
+def count_calls(stage: Callable[[], object]) -> int:
+    # Количество выполнений этапа в одном замере, чтобы замер длился не меньше MIN_SAMPLE_TIME
+    start_time = time.perf_counter()
+    stage()
+    first_time = time.perf_counter() - start_time
+    return max(1, min(int(MIN_SAMPLE_TIME / max(first_time, 1e-9)), 10000))
+
+
+def measure(stages: dict[str, Callable[[], object]], repeat_times: int) -> dict[str, dict[str, float]]:
+    """
+    Время одного выполнения каждого этапа по repeat_times замерам. Замеры выполняются по кругу
+    (по одному замеру каждого этапа за круг), relative — отношение наименьшего времени этапа
+    к наименьшему времени его калибровочного этапа (get_calibration_stage): оно почти не зависит
+    от скорости машины, а наименьшее время, в отличие от медианы, почти не зависит от фоновой нагрузки
+    """
+    calls = {name: count_calls(stage) for name, stage in stages.items()}
+    times = {name: np.empty(repeat_times) for name in stages}
+    # Как в timeit, сборщик мусора отключается: иначе время этапа зависит от того, попала ли в замер сборка
+    gc.collect()
+    gc.disable()
+    try:
+        for idx in range(repeat_times):
+            for name, stage in stages.items():
+                stage_calls = calls[name]
+                start_time = time.perf_counter()
+                for _ in range(stage_calls):
+                    stage()
+                times[name][idx] = (time.perf_counter() - start_time) / stage_calls
+            gc.collect()
+    finally:
+        gc.enable()
+
+    results = {}
+    for name, stage_times in times.items():
+        calibration_times = times.get(get_calibration_stage(name))
+        results[name] = {
+            'repeats': repeat_times,
+            'calls': calls[name],
+            **({'relative': float(stage_times.min() / calibration_times.min())}
+               if calibration_times is not None else {}),
+            'min': float(stage_times.min()),
+            'mean': float(stage_times.mean()),
+            'p50': float(np.percentile(stage_times, 50)),
+            'p90': float(np.percentile(stage_times, 90)),
+            'p99': float(np.percentile(stage_times, 99)),
+        }
+    return results
+
+
+def merge_results(results: dict[str, dict[str, float]],
+                  other_results: dict[str, dict[str, float]]) -> dict[str, dict[str, float]]:
+    # Наименьшее время каждого этапа по запускам: случайное замедление одного запуска не считается регрессией
+    merged = dict(results)
+    for name, stage_results in other_results.items():
+        if name in merged:
+            merged[name] = {key: min(value, stage_results[key]) if key in TIME_STATISTICS else value
+                            for key, value in merged[name].items()}
+    return merged
+
+
+def read_examples() -> str:
+    code_parts = []
+    for filename in sorted(os.listdir(EXAMPLES_PATH)):
+        with open(os.path.join(EXAMPLES_PATH, filename), encoding='utf8') as f:
+            code_parts.append(f.read())
+    return '\n'.join(code_parts)
+
+
+def make_stages(lines_cnt: int, model: GBDDPredictor | None) -> dict[str, Callable[[], object]]:
+    function = generate_code(lines_cnt)
+    program = '\n'.join([function] * 20)
+    metrics = MetricsCppCode(function)
+    metric_values = metrics.count()
+
+    stages: dict[str, Callable[[], object]] = {
+        'lexing': lambda: tokenize(function),
+        'set_function_code': lambda: metrics.set_function_code(function),
+        'set_function_code+count': lambda: (metrics.set_function_code(function), metrics.count()),
+        'extraction[x20]': lambda: list(extract_functions(program)),
+        'dataframe': lambda: pd.DataFrame(metric_values, index=[0]),
+    }
+    if model is not None:
+        data = pd.DataFrame(metric_values, index=[0])
+        stages['predict_proba'] = lambda: model.predict_proba(data)
+        stages['predict_proba_batch[x20]'] = lambda: model.predict_proba_batch([metric_values] * 20)
+
+    return {f'{name}[lines={lines_cnt}]': stage for name, stage in stages.items()}
+
+
+def run_benchmarks(repeat_times: int, model_file: str) -> dict[str, dict[str, float]]:
+    random.seed(SEED)
+    model = GBDDPredictor(model_file=model_file) if os.path.isfile(model_file) else None
+    if model is None:
+        print(f'There is no model file {model_file}, inference is not measured', file=sys.stderr)
+
+    examples = read_examples()
+    stages: dict[str, Callable[[], object]] = {
+        CALIBRATION_STAGE: calibration,
+        LIBRARY_CALIBRATION_STAGE: library_calibration,
+        'extraction[examples]': lambda: list(extract_functions(examples)),
+    }
+    for lines_cnt in LINES_COUNTS:
+        stages.update(make_stages(lines_cnt, model))
+
+    results = measure(stages, repeat_times)
+    for stage_name, stage_results in results.items():
+        print(f'{stage_name}: min = {stage_results["min"] * 1e3:.3f} ms, '
+              f'p50 = {stage_results["p50"] * 1e3:.3f} ms', file=sys.stderr)
+    return results
+
+
+def find_regressions(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]],
+                     tolerance: float, min_time: float = MIN_STAGE_TIME,
+                     min_increase: float = MIN_INCREASE) -> dict[str, str]:
+    """
+    Сравнение по времени относительно калибровочного этапа (relative), для базовых результатов без него —
+    по медиане. Рост времени в секундах оценивается по медиане базовых результатов.
+    Результат — описания регрессий по названиям этапов
+    """
+    regressions = {}
+    for stage, stage_baseline in baseline.items():
+        if stage not in results or stage in (CALIBRATION_STAGE, LIBRARY_CALIBRATION_STAGE):
+            continue
+        statistic = 'relative' if 'relative' in stage_baseline and 'relative' in results[stage] else 'p50'
+        ratio = results[stage][statistic] / stage_baseline[statistic]
+        if max(stage_baseline['p50'], results[stage]['p50']) < min_time:
+            continue
+        if ratio > 1 + tolerance and stage_baseline['p50'] * (ratio - 1) >= min_increase:
+            regressions[stage] = (f'{stage}: {statistic} time grew by {(ratio - 1) * 100:.0f}%, '
+                                  f'p50 = {results[stage]["p50"] * 1e3:.3f} ms, '
+                                  f'baseline = {stage_baseline["p50"] * 1e3:.3f} ms')
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.research.benchmark',
+                                     description='Замер производительности этапов анализа')
+    parser.add_argument('-o', '--output', help='файл результатов в формате JSON (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='файл базовых результатов для сравнения')
+    parser.add_argument('--save-baseline', help='сохранить результаты как базовые')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='допустимый относительный рост времени')
+    parser.add_argument('--min-time', type=float, default=MIN_STAGE_TIME * 1e6,
+                        help='этапы быстрее этого времени не сравниваются, мкс')
+    parser.add_argument('--min-increase', type=float, default=MIN_INCREASE * 1e6,
+                        help='наименьший рост времени, который считается регрессией, мкс')
+    parser.add_argument('--repeat', type=int, default=REPEAT_TIMES, help='количество повторов каждого этапа')
+    parser.add_argument('--confirm', type=int, default=CONFIRM_TIMES,
+                        help='количество запусков, в которых должна повториться регрессия')
+    parser.add_argument('--model', default=MODEL_FILE, help='файл обученной модели')
+    args = parser.parse_args(argv)
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+        },
+        'stages': run_benchmarks(args.repeat, args.model),
+    }
+
+    report_text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            f.write(report_text)
+    else:
+        print(report_text)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf8') as f:
+            f.write(report_text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf8') as f:
+            baseline = json.load(f)['stages']
+        results = report['stages']
+        regressions = find_regressions(results, baseline, args.tolerance, args.min_time / 1e6, args.min_increase / 1e6)
+        for _ in range(args.confirm - 1):
+            if not regressions:
+                break
+            # Перепроверка запускает все этапы: от набора этапов зависит время калибровочной нагрузки
+            print(f'Rechecking {len(regressions)} stages', file=sys.stderr)
+            results = merge_results(results, run_benchmarks(args.repeat, args.model))
+            regressions = find_regressions(results, baseline, args.tolerance,
+                                           args.min_time / 1e6, args.min_increase / 1e6)
+        for regression in regressions.values():
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
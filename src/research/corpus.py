@@ -0,0 +1,209 @@
+"""
+Потоковая генерация синтетического набора тестов для нагрузочной проверки анализатора:
+python -m src.research.corpus <dir> [--files N] [--jobs N] [--seed S] [--functions-max N]
+    [--lines-median N] [--lines-sigma S] [--lines-max N] [--depth-mean D] [--branch-rate P] [--defect-rate P]
+    [--legacy]
+
+Файлы N.cpp записываются по мере генерации строк, поэтому объём памяти не зависит от размера набора.
+Набор делится на части по SHARD_SIZE файлов, каждая часть генерируется в процессе пула собственным генератором
+случайных чисел с зерном (seed, номер части): результат не зависит от количества процессов.
+proba.txt содержит ожидаемую вероятность дефектов каждого файла в формате research.testing.
+С --legacy (LEGACY_CONFIG) функции и вероятности генерируются так же, как в прежнем генераторе research.testing
+"""
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, TextIO
+from src.research.utils import generate_line, get_defect
+
+SEED = 123
+SHARD_SIZE = 1000
+MAX_DEPTH = 16
+BLOCK_HEADERS = ['if ({}) {{\n', 'while ({}) {{\n', 'for (; {};) {{\n']
+
+
+class CorpusConfig(NamedTuple):
+    """
+    Распределения параметров набора:
+    functions_min, functions_max — количество функций в файле (равномерное),
+    lines_median, lines_sigma, lines_max — количество строк функции (логнормальное, с ограничением),
+    depth_mean — средняя наибольшая глубина вложенности блоков функции (экспоненциальное),
+    branch_rate — вероятность открыть или закрыть блок на очередной строке,
+    defect_rate — вероятность вставить вместо очередной строки фрагмент с ошибкой (get_defect),
+    legacy — функции прежнего генератора research.testing (write_legacy_function), распределения размера,
+    вложенности и ошибок не используются
+    """
+    functions_min: int = 1
+    functions_max: int = 1
+    lines_median: float = 50.
+    lines_sigma: float = 0.5
+    lines_max: int = 5000
+    depth_mean: float = 1.
+    branch_rate: float = 0.1
+    defect_rate: float = 0.02
+    legacy: bool = False
+
+
+LEGACY_CONFIG = CorpusConfig(legacy=True)
+
+
+def write_function(f: TextIO, name: str, rng: random.Random, config: CorpusConfig) -> tuple[int, int]:
+    """Запись одной функции, возвращает количество обычных строк и строк с ошибками"""
+    lines_cnt = int(rng.lognormvariate(math.log(config.lines_median), config.lines_sigma))
+    lines_cnt = min(max(lines_cnt, 1), config.lines_max)
+    max_depth = min(int(rng.expovariate(1 / config.depth_mean)), MAX_DEPTH) if config.depth_mean > 0 else 0
+
+    f.write(f'void {name}() {{\n')
+    code_lines_cnt = 0
+    defect_lines_cnt = 0
+    depth = 0
+
+    for _ in range(lines_cnt):
+        event = rng.random()
+        if event < config.defect_rate:
+            defect = get_defect(rng)
+            f.write(defect)
+            defect_lines_cnt += defect.count('\n')
+            continue
+
+        event -= config.defect_rate
+        if event < config.branch_rate and depth < max_depth:
+            f.write(rng.choice(BLOCK_HEADERS).format(generate_line(1, rng).rstrip('\n')))
+            depth += 1
+        elif event < 2 * config.branch_rate and depth > 0:
+            f.write('}\n')
+            depth -= 1
+        else:
+            f.write(generate_line(rng.randint(1, 4), rng))
+        code_lines_cnt += 1
+
+    f.write('}\n' * (depth + 1))
+    return code_lines_cnt + depth + 2, defect_lines_cnt
+
+
+def write_legacy_function(f: TextIO, name: str, rng: random.Random) -> tuple[int, int]:
+    """
+    Функция прежнего генератора тестов: от 10 до 100 обычных строк и от 1 до 10 фрагментов с ошибками
+    в случайном порядке, без перевода строки после закрывающей скобки. Возвращает количество обычных строк
+    и количество строк с ошибками так, как их считал прежний генератор: по числу частей split('\n')
+    последних defects_cnt элементов после перемешивания (это не обязательно фрагменты с ошибками)
+    """
+    lines_cnt = rng.randint(10, 100)
+    defects_cnt = rng.randint(1, 10)
+    code_lines = [generate_line(rng.randint(1, 4), rng) for _ in range(lines_cnt)]
+    code_lines.extend(get_defect(rng) for _ in range(defects_cnt))
+    rng.shuffle(code_lines)
+
+    f.write(f'void {name}() {{\n')
+    f.writelines(code_lines)
+    f.write('}')
+    return lines_cnt, sum(line.count('\n') + 1 for line in code_lines[-defects_cnt:])
+
+
+def generate_shard(output: str, shard: int, start: int, end: int, seed: int, config: CorpusConfig) -> int:
+    """Генерация файлов start..end - 1 (выполняется в процессе пула), возвращает количество записанных байт"""
+    rng = random.Random(f'{seed}:{shard}')
+    bytes_cnt = 0
+
+    with open(os.path.join(output, f'proba.{shard}.part'), 'w', encoding='UTF8') as proba_file:
+        for i in range(start, end):
+            path = os.path.join(output, f'{i}.cpp')
+            code_lines_cnt = 0
+            defect_lines_cnt = 0
+            with open(path, 'w', encoding='UTF8') as f:
+                for function_idx in range(rng.randint(config.functions_min, config.functions_max)):
+                    if config.legacy:
+                        if function_idx:
+                            f.write('\n')
+                        function_lines_cnt, function_defect_lines_cnt = write_legacy_function(
+                            f, f'foo{function_idx}', rng)
+                    else:
+                        function_lines_cnt, function_defect_lines_cnt = write_function(
+                            f, f'foo{function_idx}', rng, config)
+                    code_lines_cnt += function_lines_cnt
+                    defect_lines_cnt += function_defect_lines_cnt
+
+            # Отношение количества строк фрагментов с ошибками к количеству остальных строк файла, умноженное на 6.
+            # Прежний генератор делил на количество обычных строк число строк случайных элементов
+            # (write_legacy_function), поэтому совпадает с ним только с --legacy
+            proba_file.write(f'{min(defect_lines_cnt / code_lines_cnt * 6, 1.)}\n')
+            bytes_cnt += os.path.getsize(path)
+
+    return bytes_cnt
+
+
+def generate_corpus(output: str, files_cnt: int, jobs: int = os.cpu_count() or 1, seed: int = SEED,
+                    config: CorpusConfig = CorpusConfig()) -> int:
+    os.makedirs(output, exist_ok=True)
+    shards = [(output, shard, start, min(start + SHARD_SIZE, files_cnt), seed, config)
+              for shard, start in enumerate(range(0, files_cnt, SHARD_SIZE))]
+
+    if jobs == 1:
+        bytes_cnt = sum(generate_shard(*shard_args) for shard_args in shards)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            bytes_cnt = sum(executor.map(generate_shard, *zip(*shards)))
+
+    # Части файла ожидаемых вероятностей объединяются в порядке номеров файлов
+    with open(os.path.join(output, 'proba.txt'), 'w', encoding='UTF8') as proba_file:
+        for _, shard, *_ in shards:
+            part_path = os.path.join(output, f'proba.{shard}.part')
+            with open(part_path, encoding='UTF8') as part_file:
+                shutil.copyfileobj(part_file, proba_file)
+            os.remove(part_path)
+
+    return bytes_cnt
+
+
+def main(argv: list[str] | None = None):
+    defaults = CorpusConfig()
+    parser = argparse.ArgumentParser(prog='python -m src.research.corpus',
+                                     description='Генерация синтетического набора тестов')
+    parser.add_argument('output', help='каталог набора')
+    parser.add_argument('-n', '--files', type=int, default=1000, help='количество файлов')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='количество процессов')
+    parser.add_argument('--seed', type=int, default=SEED, help='зерно генератора случайных чисел')
+    parser.add_argument('--functions-min', type=int, default=defaults.functions_min,
+                        help='наименьшее количество функций в файле')
+    parser.add_argument('--functions-max', type=int, default=defaults.functions_max,
+                        help='наибольшее количество функций в файле')
+    parser.add_argument('--lines-median', type=float, default=defaults.lines_median, help='медиана размера функции')
+    parser.add_argument('--lines-sigma', type=float, default=defaults.lines_sigma,
+                        help='разброс размера функции (sigma логнормального распределения)')
+    parser.add_argument('--lines-max', type=int, default=defaults.lines_max, help='наибольший размер функции')
+    parser.add_argument('--depth-mean', type=float, default=defaults.depth_mean,
+                        help='средняя наибольшая глубина вложенности')
+    parser.add_argument('--branch-rate', type=float, default=defaults.branch_rate,
+                        help='вероятность открыть или закрыть блок на строке')
+    parser.add_argument('--defect-rate', type=float, default=defaults.defect_rate,
+                        help='вероятность вставить фрагмент с ошибкой вместо строки')
+    parser.add_argument('--legacy', action='store_true',
+                        help='функции и вероятности прежнего генератора research.testing')
+    args = parser.parse_args(argv)
+
+    if args.files < 1 or args.jobs < 1:
+        parser.error('--files and --jobs must be positive')
+    if not 1 <= args.functions_min <= args.functions_max:
+        parser.error('expected 1 <= --functions-min <= --functions-max')
+    if args.lines_median < 1 or args.lines_max < 1:
+        parser.error('--lines-median and --lines-max must be positive')
+    if args.defect_rate < 0 or args.branch_rate < 0 or args.defect_rate + 2 * args.branch_rate > 1:
+        parser.error('expected non-negative rates with --defect-rate + 2 * --branch-rate <= 1')
+
+    config = CorpusConfig(args.functions_min, args.functions_max, args.lines_median, args.lines_sigma,
+                          args.lines_max, args.depth_mean, args.branch_rate, args.defect_rate, args.legacy)
+    start_time = time.perf_counter()
+    bytes_cnt = generate_corpus(args.output, args.files, args.jobs, args.seed, config)
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+
+    print(f'files = {args.files}, size = {bytes_cnt / 2 ** 20:.1f} MB, time = {elapsed:.2f} s, '
+          f'{bytes_cnt / 2 ** 20 / elapsed:.1f} MB/s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
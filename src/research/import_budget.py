@@ -0,0 +1,63 @@
+"""
+Проверка времени импорта модулей, которым нужно только предсказание:
+python -m src.research.import_budget [--budget SECONDS]
+
+Каждый модуль импортируется в отдельном процессе. Код возврата равен 1, если импорт длится дольше бюджета
+или загружает зависимости обучения (matplotlib, sklearn, scipy, requests, pandas, xgboost)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BUDGET = 0.5
+INFERENCE_MODULES = ['src.model.inference', 'src.processing.metircs', 'src.processing.halstead',
+                     'src.scan', 'src.app.worker', 'src.app.window']
+HEAVY_MODULES = ['matplotlib', 'sklearn', 'scipy', 'requests', 'pandas', 'xgboost']
+ROOT_PATH = os.path.join(os.path.dirname(__file__), '..', '..')
+
+IMPORT_SCRIPT = '''
+import json, sys, time
+start_time = time.perf_counter()
+try:
+    __import__({module!r})
+except ModuleNotFoundError as e:
+    print(json.dumps({{'missing': e.name}}))
+    sys.exit()
+elapsed = time.perf_counter() - start_time
+print(json.dumps({{'time': elapsed, 'modules': sorted({{name.split('.')[0] for name in sys.modules}})}}))
+'''
+
+
+def measure_import(module: str) -> dict:
+    process = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(module=module)], cwd=ROOT_PATH,
+                             capture_output=True, text=True, check=True)
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.research.import_budget',
+                                     description='Проверка времени импорта модулей предсказания')
+    parser.add_argument('--budget', type=float, default=BUDGET, help='допустимое время импорта модуля, секунды')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in INFERENCE_MODULES:
+        result = measure_import(module)
+        if 'missing' in result:
+            # Модули интерфейса не проверяются, если PyQt5 не установлен
+            print(f'{module}: skipped, there is no module {result["missing"]}', file=sys.stderr)
+            continue
+
+        heavy_modules = sorted(set(result['modules']) & set(HEAVY_MODULES))
+        module_failed = result['time'] > args.budget or bool(heavy_modules)
+        failed = failed or module_failed
+        print(f'{"FAIL" if module_failed else "OK"} {module}: time = {result["time"]:.3f} s'
+              + (f', heavy modules = {", ".join(heavy_modules)}' if heavy_modules else ''), file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,116 +1,124 @@
+"""
+Проверка модели на синтетическом наборе тестов с известной вероятностью дефектов:
+python -m src.research.testing [--path DIR] [--count N] [--jobs N] [--generate] [--verbose]
+
+Метрики файлов набора вычисляются в пуле процессов, вероятности — одним пакетным вызовом модели,
+кроме статистики ошибок выводится пропускная способность
+"""
+import argparse
 import os
-import pandas as pd
-from random import choice, randint, shuffle
-from src.model.model import GBDDModel
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from src.model.config import FEATURES
+from src.model.inference import GBDDPredictor
+from src.processing.halstead import MetricsBatch
 from src.processing.metircs import MetricsCppCode
-from utils import generate_line
+from src.research.corpus import LEGACY_CONFIG, generate_corpus
 
-TEST_PATH = r'..\..\data\test'
+TEST_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'test')
+MODEL_FILE = os.path.join(os.path.dirname(__file__), '..', 'app', 'model.ubj')
 LINES_CNT = 1000
+# Допустимое отклонение вычисленной вероятности от ожидаемой
+TOLERANCE = 0.2
 
 
-def get_defect() -> str:
-    defects = [
-        'double a = 1 / 33;\n'
-        'std::cout << "Count sum..." << std::endl;\n'
-        'for (double b = 0; b < 1; b += a) {}\n',
-
-        'int sum = 0;\n'
-        'int i = 0, j = 0;  // Неверное место инициализации\n'
-        'for (; i < 10; i++) {\n'
-        'for (; j < n, j++) {\n'
-        'sum += i + j;\n'
-        '}\n'
-        '}\n',
-
-        'int array[5] = {-1, -2, -3, -4, -5};\n'
-        'int max = 0;  // Неверная инициализация\n'
-        'for (int i = 0; i < 5; i++) {\n'
-        'if (array[i] > max)\n'
-        'max = array[i];\n'
-        '}\n',
-
-        'std::string name = "file";\n'
-        '// Отсутствует обработка else, что может привести к неверному расширению\n'
-        'if (idx == 0)\n'
-        'name += ".txt";\n'
-        'else if (idx == 1)\n'
-        'name += ".cpp"\n'
-        'create_file(name);\n',
-
-        'int array[3] = { 0, 1, 2 };\n'
-        'for (int i = 0; i < 3; i++) {\n'
-        'if (i % 2 != 0) {\n'
-        '// Необходимо дополнительно аллоцировать память\n'
-        'array[i * 2] = i;\n'
-        '}\n'
-        '}\n',
-
-        'int a = 5;\n'
-        'if (name == "file" || a > 4) {\n'
-        'a = 10;\n'
-        'return &a;  // указатель на локальную переменную\n'
-        '}\n',
-    ]
-    return choice(defects)
-
-
-def generate_test(lines_cnt: int) -> tuple[str, float]:
-    code_lines: list[str] = []
-    defects_cnt = randint(1, 10)
-
-    for _ in range(lines_cnt):
-        code_lines.append(generate_line(randint(1, 4)))
-    for _ in range(defects_cnt):
-        code_lines.append(get_defect())
-
-    shuffle(code_lines)
-    proba = sum([len(line.split('\n')) for line in code_lines[-defects_cnt:]]) / lines_cnt * 6
-    proba = proba if proba <= 1. else 1.
-    return 'void foo() {\n' + ''.join(code_lines) + '}', proba
-
-
-def generate_tests():
-    expected_proba = ''
-
-    for i in range(LINES_CNT):
-        test = generate_test(randint(10, 100))
-        with open(os.path.join(TEST_PATH, f'{i}.cpp'), 'w', encoding='UTF8') as f:
-            f.write(test[0])
-        expected_proba += str(test[1]) + '\n'
-
-    with open(os.path.join(TEST_PATH, 'proba.txt'), 'w', encoding='UTF8') as f:
-        f.write(expected_proba)
-
-
-def check_results():
-    model = GBDDModel(model_file=r'..\app\model.pkl')
-    metrics = MetricsCppCode()
-    incorrect_cnt = 0
-    errors = 0.
-
-    with open(os.path.join(TEST_PATH, 'proba.txt'), encoding='UTF8') as f:
-        expected_proba = list(map(float, f.read().split()))
-
-    for i in range(LINES_CNT):
-        with open(os.path.join(TEST_PATH, f'{i}.cpp'), encoding='UTF8') as f:
-            code = f.read()
-
-        metrics.set_function_code(code)
-        code_metrics = metrics.count()
-        defects_proba = model.predict_proba(pd.DataFrame(code_metrics, index=[0]))[0][1]
-
-        if abs(defects_proba - expected_proba[i]) > 0.2:
-            print(f'LINE #{i}: expected = {expected_proba[i]}, calculated = {defects_proba}')
-            incorrect_cnt += 1
-            errors += abs(expected_proba[i] - defects_proba)
+def generate_tests(test_path: str = TEST_PATH, tests_cnt: int = LINES_CNT, jobs: int = os.cpu_count() or 1):
+    # Набор из одной функции на файл с прежними распределениями и оценкой вероятности, см. research.corpus
+    generate_corpus(test_path, tests_cnt, jobs, config=LEGACY_CONFIG)
 
-    print(f'{incorrect_cnt = }, {incorrect_cnt / LINES_CNT:.2f}%, {errors = :.2f}')
 
-
-def main():
-    # generate_tests()
-    check_results()
+def count_file_metrics(path: str) -> tuple[int, ...] | None:
+    """Метрики одного файла набора (выполняется в процессе пула), None — файл не удалось прочитать"""
+    try:
+        with open(path, encoding='UTF8') as f:
+            code = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    return MetricsCppCode(code).count_raw()
+
+
+def check_results(test_path: str = TEST_PATH, tests_cnt: int | None = None, jobs: int = os.cpu_count() or 1,
+                  model_file: str = MODEL_FILE, verbose: bool = False) -> dict[str, int | float]:
+    model = GBDDPredictor(model_file=model_file)
+    # Загрузка модели и отложенный импорт XGBoost выполняются до замеров, чтобы не искажать пропускную способность
+    model.predict_proba_matrix(np.zeros((1, len(FEATURES)), dtype=np.float32))
+
+    with open(os.path.join(test_path, 'proba.txt'), encoding='UTF8') as f:
+        expected_proba = np.array(f.read().split(), dtype=np.float64)
+    if tests_cnt is not None:
+        expected_proba = expected_proba[:tests_cnt]
+    paths = [os.path.join(test_path, f'{i}.cpp') for i in range(len(expected_proba))]
+
+    start_time = time.perf_counter()
+    if jobs == 1:
+        counts = list(map(count_file_metrics, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            counts = list(executor.map(count_file_metrics, paths, chunksize=64))
+    metrics_time = time.perf_counter() - start_time
+
+    read = np.array([file_counts is not None for file_counts in counts], dtype=bool)
+    metrics_batch = MetricsBatch()
+    for file_counts in counts:
+        if file_counts is not None:
+            metrics_batch.append(file_counts)
+
+    start_time = time.perf_counter()
+    calculated_proba = model.predict_proba_matrix(metrics_batch.to_matrix(FEATURES))
+    predict_time = time.perf_counter() - start_time
+
+    expected_proba = expected_proba[read]
+    deviations = np.abs(calculated_proba - expected_proba)
+    incorrect = deviations > TOLERANCE
+    if verbose:
+        for i, expected, calculated in zip(np.flatnonzero(read)[incorrect], expected_proba[incorrect],
+                                           calculated_proba[incorrect]):
+            print(f'LINE #{i}: expected = {expected}, calculated = {calculated}')
+
+    tests_cnt = len(expected_proba)
+    elapsed = max(metrics_time + predict_time, 1e-9)
+    statistics = {
+        'tests': tests_cnt,
+        'unreadable': int(len(read) - tests_cnt),
+        'incorrect': int(incorrect.sum()),
+        'incorrect_share': float(incorrect.mean()) if tests_cnt else 0.,
+        'errors': float(deviations[incorrect].sum()),
+        'mae': float(deviations.mean()) if tests_cnt else 0.,
+        'metrics_time': metrics_time,
+        'predict_time': predict_time,
+        'files_per_second': len(read) / elapsed,
+    }
+
+    print(f'incorrect_cnt = {statistics["incorrect"]}, {statistics["incorrect_share"] * 100:.2f}%, '
+          f'errors = {statistics["errors"]:.2f}, mae = {statistics["mae"]:.3f}, '
+          f'unreadable = {statistics["unreadable"]}')
+    print(f'tests = {len(read)}, metrics = {metrics_time:.2f} s, predict = {predict_time:.2f} s, '
+          f'{statistics["files_per_second"]:.1f} files/s')
+    return statistics
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog='python -m src.research.testing',
+                                     description='Проверка модели на синтетическом наборе тестов')
+    parser.add_argument('--path', default=TEST_PATH, help='каталог набора тестов (N.cpp и proba.txt)')
+    parser.add_argument('-n', '--count', type=int, default=None, help='количество тестов (по умолчанию все)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='количество процессов для вычисления метрик')
+    parser.add_argument('--model', default=MODEL_FILE, help='файл обученной модели')
+    parser.add_argument('--generate', action='store_true', help='сгенерировать набор тестов перед проверкой')
+    parser.add_argument('-v', '--verbose', action='store_true', help='выводить тесты с большим отклонением')
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error('--jobs must be positive')
+
+    if args.generate:
+        generate_tests(args.path, args.count or LINES_CNT, args.jobs)
+    if not os.path.isfile(os.path.join(args.path, 'proba.txt')):
+        print(f'There is no test set in {args.path}, run with --generate', file=sys.stderr)
+        return
+    check_results(args.path, args.count, args.jobs, args.model, args.verbose)
 
 
 if __name__ == '__main__':
@@ -1,17 +1,64 @@
-from random import choice
+import random
 
+OPERATORS = ['+', '-', '*', '/', '=', '<', '>', 'if', '&&', '||']
+OPERANDS = ['a', 'b', 'c', 'd', '1', '2', '3', '4']
 
-def generate_line(operators_cnt: int) -> str:
-    operators = ['+', '-', '*', '/', '=', '<', '>', 'if', '&&', '||']
-    operands = ['a', 'b', 'c', 'd', '1', '2', '3', '4']
-    line = [f'{choice(operands)} {choice(operators)}' for _ in range(operators_cnt)]
-    return ' '.join(line) + f' {choice(operands)}\n'
+# Фрагменты кода с типичными ошибками
+DEFECTS = [
+    'double a = 1 / 33;\n'
+    'std::cout << "Count sum..." << std::endl;\n'
+    'for (double b = 0; b < 1; b += a) {}\n',
 
+    'int sum = 0;\n'
+    'int i = 0, j = 0;  // Неверное место инициализации\n'
+    'for (; i < 10; i++) {\n'
+    'for (; j < n, j++) {\n'
+    'sum += i + j;\n'
+    '}\n'
+    '}\n',
 
-def generate_code(lines_cnt: int) -> str:
-    code = 'void foo() {\n'
+    'int array[5] = {-1, -2, -3, -4, -5};\n'
+    'int max = 0;  // Неверная инициализация\n'
+    'for (int i = 0; i < 5; i++) {\n'
+    'if (array[i] > max)\n'
+    'max = array[i];\n'
+    '}\n',
 
-    for _ in range(lines_cnt):
-        code += generate_line(4)
+    'std::string name = "file";\n'
+    '// Отсутствует обработка else, что может привести к неверному расширению\n'
+    'if (idx == 0)\n'
+    'name += ".txt";\n'
+    'else if (idx == 1)\n'
+    'name += ".cpp"\n'
+    'create_file(name);\n',
 
-    return code + '}\n'
+    'int array[3] = { 0, 1, 2 };\n'
+    'for (int i = 0; i < 3; i++) {\n'
+    'if (i % 2 != 0) {\n'
+    '// Необходимо дополнительно аллоцировать память\n'
+    'array[i * 2] = i;\n'
+    '}\n'
+    '}\n',
+
+    'int a = 5;\n'
+    'if (name == "file" || a > 4) {\n'
+    'a = 10;\n'
+    'return &a;  // указатель на локальную переменную\n'
+    '}\n',
+]
+
+
+def generate_line(operators_cnt: int, rng: random.Random = random) -> str:
+    line = [f'{rng.choice(OPERANDS)} {rng.choice(OPERATORS)}' for _ in range(operators_cnt)]
+    return ' '.join(line) + f' {rng.choice(OPERANDS)}\n'
+
+
+def generate_code(lines_cnt: int, rng: random.Random = random) -> str:
+    code_lines = ['void foo() {\n']
+    code_lines.extend(generate_line(4, rng) for _ in range(lines_cnt))
+    code_lines.append('}\n')
+    return ''.join(code_lines)
+
+
+def get_defect(rng: random.Random = random) -> str:
+    return rng.choice(DEFECTS)
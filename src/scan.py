@@ -0,0 +1,253 @@
+"""
+Консольный поиск дефектов во всех исходных файлах C++ каталога:
+python -m src.scan <dir> [--jobs N] [--include GLOB] [--exclude GLOB] [--format jsonl|csv] [--output FILE]
+        [--profile FILE] [--cache FILE | --no-cache]
+
+Метрики функций вычисляются в пуле процессов, вероятности дефектов — пакетами,
+результаты выводятся построчно по мере готовности, сводка производительности — в stderr.
+Метрики и вероятности уже встречавшихся функций берутся из постоянного кэша (cache.FunctionCache).
+С --profile времена этапов (в том числе в процессах пула) сохраняются в JSON или, для файла .prom, в формате Prometheus
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from fnmatch import fnmatch
+from typing import Iterable, Iterator, TextIO
+import numpy as np
+from src.model.config import FEATURES
+from src.model.inference import GBDDPredictor
+from src.processing.cache import DEFAULT_CACHE_FILE, FunctionCache
+from src.processing.functions import find_functions, function_hash
+from src.processing.halstead import FLOAT_FEATURES, MetricsBatch
+from src.processing.metircs import MetricsCppCode
+from src.processing.profiling import PROFILER
+
+DEFAULT_INCLUDE = ['*.cpp', '*.h']
+DEFAULT_MODEL_FILE = os.path.join(os.path.dirname(__file__), 'app', 'model.ubj')
+BATCH_SIZE = 1024
+RESULT_COLUMNS = ['file', 'start_line', 'end_line', 'defects_proba']
+
+# Кэш функций текущего процесса (основного или процесса пула), задаётся в _init_worker
+_cache: FunctionCache | None = None
+_model_digest = ''
+
+
+def matches(path: str, patterns: Iterable[str]) -> bool:
+    return any(fnmatch(path, pattern) or fnmatch(os.path.basename(path), pattern) for pattern in patterns)
+
+
+def find_sources(root: str, include: list[str], exclude: list[str]) -> Iterator[str]:
+    for directory, dirnames, filenames in os.walk(root):
+        relative_directory = os.path.relpath(directory, root)
+        dirnames[:] = sorted(name for name in dirnames
+                             if not matches(os.path.normpath(os.path.join(relative_directory, name)), exclude))
+
+        for filename in sorted(filenames):
+            relative_path = os.path.normpath(os.path.join(relative_directory, filename))
+            if matches(relative_path, include) and not matches(relative_path, exclude):
+                yield os.path.join(directory, filename)
+
+
+def analyze_file(path: str) -> list[dict]:
+    """
+    Непосредственно подсчитываемые метрики всех функций файла (выполняется в процессе пула),
+    производные метрики вычисляются в основном процессе сразу для пакета функций.
+    Для функций из кэша метрики не вычисляются, а defects_proba содержит сохранённую вероятность.
+    Номера строк в результатах начинаются с единицы
+    """
+    with open(path, encoding='utf8', errors='replace') as f:
+        code = f.read()
+
+    functions = find_functions(code)
+    hashes = [function_hash(function.text) for function in functions]
+    cached = _cache.get_many(hashes, _model_digest) if _cache is not None else {}
+
+    metrics = MetricsCppCode()
+    results: list[dict] = []
+    for function, body_hash in zip(functions, hashes):
+        if body_hash in cached:
+            counts, defects_proba = cached[body_hash]
+        else:
+            metrics.set_function_code(function.text)
+            counts, defects_proba = metrics.count_raw(), None
+        results.append({
+            'file': path,
+            'start_line': function.start_line + 1,
+            'end_line': function.end_line,
+            'hash': body_hash,
+            'counts': counts,
+            'defects_proba': defects_proba,
+        })
+
+    return results
+
+
+class ResultWriter:
+    def __init__(self, output: TextIO, output_format: str):
+        self.__output = output
+        self.__csv_writer = None
+        if output_format == 'csv':
+            self.__csv_writer = csv.DictWriter(output, fieldnames=RESULT_COLUMNS + FEATURES)
+            self.__csv_writer.writeheader()
+
+    def write(self, result: dict, defects_proba: float, features: list[float]):
+        row = {column: result[column] for column in RESULT_COLUMNS[:-1]}
+        row['defects_proba'] = round(float(defects_proba), 4)
+        for feature, value in zip(FEATURES, features):
+            row[feature] = value if feature in FLOAT_FEATURES else int(value)
+
+        if self.__csv_writer is not None:
+            self.__csv_writer.writerow(row)
+        else:
+            self.__output.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self.__output.flush()
+
+
+def _init_worker(profile: bool, cache_file: str | None, model_digest: str):
+    global _cache, _model_digest
+    PROFILER.enable(profile)
+    _cache = FunctionCache(cache_file) if cache_file is not None else None
+    _model_digest = model_digest
+
+
+def _analyze_file_profiled(path: str) -> tuple[list[dict], dict | None]:
+    # Замеры процесса пула передаются вместе с результатами и объединяются в основном процессе
+    results = analyze_file(path)
+    if not PROFILER.enabled:
+        return results, None
+    snapshot = PROFILER.snapshot()
+    PROFILER.reset()
+    return results, snapshot
+
+
+def iter_results(paths: Iterable[str], jobs: int, cache_file: str | None = None,
+                 model_digest: str = '') -> Iterator[list[dict]]:
+    worker_args = (PROFILER.enabled, cache_file, model_digest)
+    if jobs == 1:
+        _init_worker(*worker_args)
+        yield from map(analyze_file, paths)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=worker_args) as executor:
+        try:
+            for results, snapshot in executor.map(_analyze_file_profiled, paths, chunksize=8):
+                if snapshot is not None:
+                    PROFILER.merge(snapshot)
+                yield results
+        except GeneratorExit:
+            # Результаты больше не нужны (например, закрыт вывод): оставшиеся файлы не анализируются
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def scan(root: str, model_file: str, writer: ResultWriter, jobs: int,
+         include: list[str], exclude: list[str], cache_file: str | None = None) -> tuple[int, int]:
+    model = GBDDPredictor(model_file=model_file)
+    model_digest = model.model_digest()
+    cache = FunctionCache(cache_file) if cache_file is not None else None
+    files_cnt = 0
+    functions_cnt = 0
+    batch: list[dict] = []
+    metrics_batch = MetricsBatch()
+
+    def flush():
+        for result in batch:
+            metrics_batch.append(result['counts'])
+        X = metrics_batch.to_matrix(FEATURES, dtype=np.float64)
+
+        # Модель вызывается только для функций, которых не было в кэше
+        uncached = [idx for idx, result in enumerate(batch) if result['defects_proba'] is None]
+        if uncached:
+            uncached_proba = model.predict_proba_matrix(X[uncached].astype(np.float32))
+            for idx, defects_proba in zip(uncached, uncached_proba.tolist()):
+                batch[idx]['defects_proba'] = defects_proba
+            if cache is not None:
+                cache.put_many(((batch[idx]['hash'], batch[idx]['counts'], batch[idx]['defects_proba'])
+                                for idx in uncached), model_digest)
+        PROFILER.increment('scan.cache_hits', len(batch) - len(uncached))
+
+        for result, features in zip(batch, X.tolist()):
+            writer.write(result, result['defects_proba'], features)
+        writer.flush()
+        batch.clear()
+        metrics_batch.clear()
+
+    with closing(iter_results(find_sources(root, include, exclude), jobs, cache_file, model_digest)) as results:
+        for file_results in results:
+            files_cnt += 1
+            functions_cnt += len(file_results)
+            batch.extend(file_results)
+            if len(batch) >= BATCH_SIZE:
+                flush()
+
+    if batch:
+        flush()
+    if cache is not None:
+        cache.close()
+
+    return files_cnt, functions_cnt
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m src.scan',
+                                     description='Поиск дефектов в исходных файлах C++ каталога')
+    parser.add_argument('root', help='каталог с исходными файлами')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='количество процессов для вычисления метрик')
+    parser.add_argument('--include', action='append', default=None,
+                        help=f'шаблон анализируемых файлов (по умолчанию {" ".join(DEFAULT_INCLUDE)})')
+    parser.add_argument('--exclude', action='append', default=[], help='шаблон исключаемых файлов и каталогов')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help='формат результатов')
+    parser.add_argument('-o', '--output', help='файл результатов (по умолчанию stdout)')
+    parser.add_argument('--model', default=DEFAULT_MODEL_FILE, help='файл обученной модели')
+    parser.add_argument('--profile', help='файл замеров времени этапов (.json или .prom)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE, help='файл кэша метрик и вероятностей функций')
+    parser.add_argument('--no-cache', dest='cache', action='store_const', const=None, help='не использовать кэш')
+
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.root):
+        parser.error(f'there is no directory {args.root}')
+    if not os.path.isfile(args.model):
+        parser.error(f'there is no model file {args.model}, do fit before scan')
+    if args.jobs < 1:
+        parser.error('--jobs must be positive')
+    args.include = args.include or DEFAULT_INCLUDE
+    return args
+
+
+def main(argv: list[str] | None = None):
+    args = parse_args(argv)
+    if args.profile:
+        PROFILER.enable()
+    output = open(args.output, 'w', encoding='utf8', newline='') if args.output else sys.stdout
+
+    start_time = time.perf_counter()
+    try:
+        files_cnt, functions_cnt = scan(args.root, args.model, ResultWriter(output, args.format),
+                                        args.jobs, args.include, args.exclude, args.cache)
+    except BrokenPipeError:
+        # Читатель вывода завершился раньше (python -m src.scan DIR | head): выход без трассировки.
+        # stdout перенаправляется в devnull, чтобы интерпретатор при завершении не дописывал в него буфер
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+
+    print(f'files = {files_cnt}, functions = {functions_cnt}, time = {elapsed:.2f} s, '
+          f'{files_cnt / elapsed:.1f} files/s, {functions_cnt / elapsed:.1f} functions/s', file=sys.stderr)
+
+    if args.profile:
+        PROFILER.dump(args.profile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+import pytest
+from src.processing.functions import extract_functions
+
+
+@pytest.mark.parametrize('code, expected', [
+    ('int f(int a) { return a; }', ['int f(int a) { return a; }']),
+    ('namespace n { void A::g() const noexcept { x(); } }', ['void A::g() const noexcept { x(); }']),
+    ('struct S : Base { int v; S() : v(0) {} };', ['S() : v(0) {}']),
+    ('Foo() : a{1}, b{2} {}', ['Foo() : a{1}, b{2} {}']),
+    ('Foo::Foo(int x) : Base{x}, v{{1, 2}, {3}}, s("}") { run(); }\nint g() { return 0; }',
+     ['Foo::Foo(int x) : Base{x}, v{{1, 2}, {3}}, s("}") { run(); }', 'int g() { return 0; }']),
+    ('struct S { S() :a{/* } */ 1}, b(2) {} };', ['S() :a{/* } */ 1}, b(2) {}']),
+    ('int x = f(1), y{2};\nclass C : public B, public D { void h() {} };', ['void h() {}']),
+    ('const char *s = "void f() {}";\n// int g() {}\nif_like(x) { }', ['if_like(x) { }']),
+])
+def test_extract_functions(code: str, expected: list[str]):
+    assert [function.text for function in extract_functions(code)] == expected
+
+
+def test_function_lines():
+    code = 'int a;\n\nvoid f()\n{\n    g();\n}\n'
+    function, = extract_functions(code)
+    assert (function.start_line, function.end_line) == (2, 6)
+    assert code[function.start_offset:function.end_offset] == function.text
@@ -0,0 +1,53 @@
+import random
+import time
+from src.processing.metircs import MetricsCppCode
+from src.research.utils import generate_code
+
+
+def count_code(code: str) -> dict:
+    metrics = MetricsCppCode()
+    metrics.set_function_code(code)
+    return metrics.count()
+
+
+def count_stream(chunks) -> dict:
+    metrics = MetricsCppCode()
+    metrics.set_function_stream(chunks)
+    return metrics.count()
+
+
+def split_code(code: str, rng: random.Random, max_size: int = 40) -> list[str]:
+    chunks = []
+    start = 0
+    while start < len(code):
+        size = rng.randint(1, max_size)
+        chunks.append(code[start:start + size])
+        start += size
+    return chunks
+
+
+def test_stream_matches_code():
+    rng = random.Random(0)
+    snippets = ['/* a\n b * / c\n */', '"x\\\n y\\\n"', "'a\\\n'", '/*\n\n', '"open\\\n', '// c\n', '/**/', '/*/ */']
+    for _ in range(1000):
+        if rng.random() < 0.3:
+            code = generate_code(rng.randint(1, 30), rng)
+        else:
+            code = 'void f() {\n' + ''.join(rng.choice(snippets) + rng.choice(['', ' x;\n', '\n'])
+                                            for _ in range(rng.randint(0, 8)))
+        assert count_stream(split_code(code, rng)) == count_code(code), code
+
+
+def test_stream_long_comment_is_linear():
+    def stream_time(lines_cnt: int) -> float:
+        code = 'int f() {\n/*' + 'comment line\n' * lines_cnt + '*/ return 0;\n}\n'
+        chunks = [code[i:i + 7] for i in range(0, len(code), 7)]
+        start = time.perf_counter()
+        count_stream(chunks)
+        return time.perf_counter() - start
+
+    stream_time(1000)
+    # Лучшее из нескольких запусков; при квадратичном разборе отношение было бы около 16
+    short_time = min(stream_time(5000) for _ in range(3))
+    long_time = min(stream_time(20000) for _ in range(3))
+    assert long_time < 8 * short_time